@@ -7,23 +7,26 @@ import re
 import os
 import math
 import asyncio
+from datetime import datetime
 from typing import Optional
 from mysql.connector import Error    # Moody.py
 import pathlib
 from lib.database import MySQLStorage
 from lib.analyser import ColorAnalyser
+from lib.context import ThemeContext
+from lib.render import RenderPool
+from lib.http_client import HttpClient
+from lib.thumbnails import ThumbnailCache
+from lib.jobs import AnalysisQueue
+from lib.extractors import HISTOGRAM_DTYPE, histogram_intersection
 # In Moody.py
 from discord.ext import commands
 import random
 import discord
 import logging
-import aiohttp
 import traceback
-from colormath.color_objects import LabColor, sRGBColor
-from colormath.color_conversions import convert_color
-from _delta_e import delta_e_cie2000
+from _delta_e import delta_e_cie2000, hex_to_lab
 import numpy as np
-import matplotlib.pyplot as plt
 from collections import Counter
 from sklearn.cluster import KMeans
 
@@ -43,7 +46,13 @@ class MoodyBot(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.db = MySQLStorage()
-        self.analyzer = ColorAnalyser()
+        self.http = HttpClient()
+        self.analyzer = ColorAnalyser(palette_cache=self.db, http_client=self.http)
+        self.analysis_queue = AnalysisQueue(self.db, self.analyzer)
+        self.renderer = RenderPool()
+        self.thumbnails = ThumbnailCache()
+        self.thumbnail_fetch_concurrency = 5
+        self.thumbnail_fetch_timeout = 10  # seconds per image
         self.logger = logging.getLogger(__name__)
         self.pending_submissions = {}
     @commands.Cog.listener()
@@ -51,6 +60,7 @@ class MoodyBot(commands.Cog):
         """Called when connected to Discord"""
         await self.db.initialize()
         await self.db.init_db()
+        await self.analysis_queue.start()
         await self.bot.change_presence(activity=discord.Activity(
             type=discord.ActivityType.watching, 
             name="for art submissions"
@@ -80,11 +90,22 @@ class MoodyBot(commands.Cog):
             pass
         except Exception as e:
             self.logger.error(f"Image processing failed: {e}")
+    async def cog_unload(self):
+        """Release the analysis worker pool, HTTP session and DB pool on shutdown"""
+        await self.analysis_queue.close()
+        await self.analyzer.close()
+        await self.renderer.close()
+        await self.http.close()
+        await self.db.close()
     async def emergency_shutdown(self):
         """Cleanup resources if initialization fails"""
         try:
+            if self.analysis_queue:
+                await self.analysis_queue.close()
             if self.analyzer:
                 await self.analyzer.close()
+            if self.http:
+                await self.http.close()
             if self.db:
                 await self.db.close()
         except Exception as e:
@@ -125,35 +146,19 @@ class MoodyBot(commands.Cog):
 
             image_url = ctx.message.attachments[0].url
 
-        # 1. First create submitter
-            submitter = await self.db.get_or_create_submitter(
-            submitter_id=str(ctx.author.id),
-            name=ctx.author.display_name
-        )
-        # 2. Then create artist with proper key names
-            artist = await self.db.get_or_create_artist(artist_name=metadata['name'], social_media_link=metadata['social'])
-
-        # 3. Then create artwork
-            artwork = await self.db.create_artwork(
-            submitter_id=submitter['id'],
-            artist_id=artist['id'],
-            image_url=image_url,
-            title=metadata['title'],
-            description=metadata['desc'],
-            tags=metadata['tags']
-        )
-
-        # 4. Extract and store colors
-            try:
-                colors = await self.analyzer.extract_palettes(image_url)
-                print (colors)
-                await self.db.store_palette(
-                artwork_id=artwork,
-                colors=colors
+        # Store the submission with a pending analysis job; workers extract the palette
+            artwork = await self.db.submit(
+                submitter_id=str(ctx.author.id),
+                submitter_name=ctx.author.display_name,
+                artist_name=metadata['name'],
+                social_media_link=metadata['social'],
+                image_url=image_url,
+                title=metadata['title'],
+                description=metadata['desc'],
+                tags=metadata['tags'] or [],
+                enqueue_analysis=True
             )
-            except Exception as e:
-                self.logger.error(f"Color analysis failed: {e}")
-                await ctx.send("⚠️ Color analysis failed, but artwork was submitted successfully.")
+            self.analysis_queue.notify()
 
         # Create embed
             embed = discord.Embed(
@@ -166,7 +171,7 @@ class MoodyBot(commands.Cog):
             embed.set_footer(text=f'Artwork ID: {artwork}')
             await ctx.send(embed=embed)
 
-            await ctx.send("✅ Artwork submitted successfully!")
+            await ctx.send("✅ Artwork submitted successfully! Its palette will be analysed shortly.")
 
         except Exception as e:
             self.logger.error(f"Submission error: {e}", exc_info=True)
@@ -175,23 +180,21 @@ class MoodyBot(commands.Cog):
     async def show_theme_trends(self, ctx, *, theme: str):
         """Modern color trend analysis with fixed numpy compatibility"""
         try:
-            # 1. Get artworks with theme tag
-            theme_artworks = await self.db.get_artworks_by_tag(theme.lower())
-            if not theme_artworks:
+            # 1. Get artworks with theme tag (palettes come back in the same query)
+            context = await ThemeContext.load(self.db, theme.lower())
+            if not context.artworks:
                 return await ctx.send(f"❌ No artworks found with '{theme}' tag")
 
             # 2. Process colors with error handling
             artwork_color_data = []
-            for artwork in theme_artworks:
-                palette = await self.db.get_artwork_palette(artwork['id'])
+            for artwork in context.artworks:
+                palette = context.palette(artwork['id'])
                 if not palette:
                     continue
                 
                 lab_colors = []
-                for color in palette:
+                for color, lab in zip(palette, context.labs(artwork['id'])):
                     try:
-                        rgb = sRGBColor.new_from_rgb_hex(color['hex_code'])
-                        lab = convert_color(rgb, LabColor)
                         lab_colors.append({
                             'lab': lab,
                             'hex': color['hex_code'],
@@ -211,10 +214,11 @@ class MoodyBot(commands.Cog):
                 return await ctx.send(f"❌ No valid color data for '{theme}'")
 
             # 3. Find reference color (most dominant)
-            reference_color = max(
+            reference = max(
                 (c for ad in artwork_color_data for c in ad['colors']),
                 key=lambda x: x['dominance']
-            )['lab']
+            )
+            reference_color = reference['lab']
 
             # 4. Score artworks by color similarity
             scored_artworks = []
@@ -224,10 +228,7 @@ class MoodyBot(commands.Cog):
                 
                 for color in artwork['colors']:
                     try:
-                        # FIXED: Proper float conversion
-                        lab1 = (reference_color.lab_l, reference_color.lab_a, reference_color.lab_b)
-                        lab2 = (color['lab'].lab_l, color['lab'].lab_a, color['lab'].lab_b)
-                        delta_e = delta_e_cie2000(lab1, lab2)
+                        delta_e = delta_e_cie2000(reference_color, color['lab'])
                         similarity = max(0, 100 - delta_e)
                         score += similarity * (1/color['dominance'])
                         best_matches.append({
@@ -251,46 +252,16 @@ class MoodyBot(commands.Cog):
                 return await ctx.send("❌ No valid color matches found")
                 
             top_artworks = sorted(scored_artworks, key=lambda x: x['score'], reverse=True)[:5]
-            await self._send_trend_results(ctx, theme, reference_color, top_artworks)
+            await self._send_trend_results(ctx, theme, reference['hex'], top_artworks)
 
         except Exception as e:
             await ctx.send(f"❌ Error: {str(e)}")
             self.logger.error(f"Trend error: {traceback.format_exc()}")
 
-    async def _send_trend_results(self, ctx, theme, reference_color, artworks):
+    async def _send_trend_results(self, ctx, theme, ref_rgb, artworks):
         """Send formatted trend results"""
-        # Generate visualization
-        fig, ax = plt.subplots(figsize=(10, 6))
-        
-        # Convert reference color for display
-        ref_rgb = convert_color(reference_color, sRGBColor).get_rgb_hex()
-        
-        # Plot each artwork's best matches
-        for i, artwork in enumerate(artworks):
-            for match in artwork['best_matches']:
-                rgb = tuple(int(match['hex'].lstrip('#')[i:i+2], 16) for i in (0, 2, 4))
-                rgb = tuple(c/255 for c in rgb)
-                size = max(10, 100 - match['delta_e'])
-                
-                ax.scatter(
-                    match['delta_e'],
-                    artwork['score'],
-                    c=[rgb],
-                    s=size,
-                    alpha=0.7,
-                    label=f"{artwork['artwork']['title']}" if i == 0 else ""
-                )
-        
-        ax.set_xlabel('Color Difference (ΔE) → More Similar')
-        ax.set_ylabel('Match Score')
-        ax.set_title(f"Color Trends for '{theme}'")
-        ax.legend()
-        
-        # Save and send
-        buffer = io.BytesIO()
-        plt.savefig(buffer, format='png', bbox_inches='tight', dpi=100)
-        plt.close()
-        buffer.seek(0)
+        # Generate visualization on the render pool
+        buffer = io.BytesIO(await self.renderer.render('trend_scatter', theme, artworks))
         
         # Create embed
         embed = discord.Embed(
@@ -309,57 +280,74 @@ class MoodyBot(commands.Cog):
             )
         
         await ctx.send(file=discord.File(buffer, "trend.png"), embed=embed)
+    def _cluster_connections(self, artworks, clusters, colors_per_artwork):
+        """(artwork_index, cluster_index, hex) for each matched color's first matching cluster"""
+        connections = []
+        for i, artwork in enumerate(artworks):
+            for color in artwork['matched_colors'][:colors_per_artwork]:
+                for j, cluster in enumerate(clusters[:5]):
+                    if self._color_in_cluster(color, cluster):
+                        connections.append((i, j, color))
+                        break
+        return connections
+
     async def _generate_overlap_visualization(self, artworks, clusters):
         """Generate color overlap visualization."""
-        from matplotlib import pyplot as plt
+        artworks = artworks[:5]
 
-        fig, ax = plt.subplots(figsize=(12, 8))
+        # Fetch phase: all thumbnails concurrently, then render from plain data
+        thumbnails = await self._fetch_thumbnails(
+            [(artwork.get('proxied_url'), artwork['artwork']['id']) for artwork in artworks]
+        )
+        connections = self._cluster_connections(artworks, clusters, 3)
 
-        # Plot clusters
-        for i, cluster in enumerate(clusters[:5]):
-            ax.scatter(
-                i, 1,
-                color=cluster['representative'],
-                s=500,
-                label=f"Group {i+1}"
-            )
+        png = await self.renderer.render(
+            'overlap_diagram', clusters, thumbnails, connections, len(artworks)
+        )
+        return io.BytesIO(png)
 
-        # Plot artworks
-        for i, artwork in enumerate(artworks[:5]):
-            img = await self._download_image(artwork['proxied_url'], size=(200, 200))
-            ax.imshow(
-                img,
-                extent=(i-0.4, i+0.4, 0, 0.8),
-                zorder=0
-            )
+    async def _fetch_thumbnails(self, sources, size=(200, 200)):
+        """Fetch (url, artwork_id) thumbnails concurrently, in order
 
-            # Draw connection lines
-            for color in artwork['matched_colors'][:3]:
-                for j, cluster in enumerate(clusters[:5]):
-                    if self._color_in_cluster(color, cluster):
-                        ax.plot(
-                            [i, j],
-                            [0.8, 1],
-                            color=color,
-                            alpha=0.6,
-                            linewidth=2
-                        )
-                        break
+        Downloads run under a semaphore with a per-image timeout; any image
+        that fails or is too slow becomes a placeholder tile instead of
+        failing the whole response.
+        """
+        semaphore = asyncio.Semaphore(self.thumbnail_fetch_concurrency)
+
+        async def fetch(url, artwork_id):
+            async with semaphore:
+                try:
+                    return await asyncio.wait_for(
+                        self._download_image(url, size=size, artwork_id=artwork_id),
+                        timeout=self.thumbnail_fetch_timeout
+                    )
+                except Exception as e:
+                    self.logger.warning(f"Thumbnail for artwork {artwork_id} unavailable: {e!r}")
+                    return self._placeholder_tile(size)
 
-        ax.set_xlim(-0.5, max(4.5, len(artworks)-0.5))
-        ax.set_ylim(-0.1, 1.5)
-        ax.axis('off')
-        ax.legend(loc='upper center', ncol=5)
+        return await asyncio.gather(*(fetch(url, artwork_id) for url, artwork_id in sources))
 
-        buffer = io.BytesIO()
-        plt.savefig(buffer, format='png', bbox_inches='tight', dpi=120)
-        plt.close()
-        buffer.seek(0)
-        return buffer
+    def _placeholder_tile(self, size):
+        """Neutral grey tile drawn in place of an image that couldn't be fetched"""
+        img = Image.new('RGB', size, (200, 200, 200))
+        draw = ImageDraw.Draw(img)
+        draw.line([(0, 0), size], fill=(160, 160, 160), width=3)
+        draw.line([(0, size[1]), (size[0], 0)], fill=(160, 160, 160), width=3)
+        return img
 
     async def _download_image(self, url, size=None, artwork_id=None):
-        """Download and optionally resize image, with fallback to Discord proxy."""
+        """Download and optionally resize image, with fallback to Discord proxy.
+
+        Thumbnails (size given) of a known artwork are served from the
+        thumbnail cache when present, without any network call.
+        """
         try:
+            if size and artwork_id:
+                cached = await self.thumbnails.get(artwork_id, size)
+                if cached is not None:
+                    return cached
+
             # If the URL is invalid or missing, fetch the CDN URL from the database
             if not url and artwork_id:
                 url = await self.db.get_cdn_url(artwork_id)
@@ -368,68 +356,53 @@ class MoodyBot(commands.Cog):
             if not url or not url.startswith("http"):
                 raise ValueError(f"Invalid URL: {url}")
 
-            # Attempt to fetch the image
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url) as response:
-                    if response.status != 200:
-                        raise ValueError(f"Failed to fetch image from URL: {url}")
-                    img_data = await response.read()
+            # Attempt to fetch the image over the shared connection pool
+            img_data = await self.http.get_bytes(url)
 
             # Open and optionally resize the image
             img = Image.open(io.BytesIO(img_data))
             if size:
                 img.thumbnail(size)
+                if artwork_id:
+                    await self.thumbnails.put(artwork_id, size, img)
             return img
 
         except Exception as e:
             self.logger.error(f"Image download failed: {e}")
             raise
     def _hex_to_lab(self, hex_color):
-        """Convert hex color to LAB color space"""
+        """Convert hex color to an (L, a, b) tuple via the shared memoised converter"""
         try:
-            rgb = tuple(int(hex_color.lstrip('#')[i:i+2], 16) for i in (0, 2, 4))
-            srgb = sRGBColor(*rgb, is_upscaled=True)
-            return convert_color(srgb, LabColor)
+            return hex_to_lab(hex_color)
         except Exception as e:
             self.logger.error(f"Color conversion failed for {hex_color}: {e}")
-            return LabColor(50, 0, 0)  # Neutral gray as fallback
-
-    def _get_lab_values(self, lab_color):
-        """Extract LAB components as tuple"""
-        return (lab_color.lab_l, lab_color.lab_a, lab_color.lab_b)
+            return (50.0, 0.0, 0.0)  # Neutral gray as fallback
 
     def _calculate_delta_e(self, hex1, hex2):
         """Calculate color difference between two hex colors"""
         try:
-            lab1 = self._hex_to_lab(hex1)
-            lab2 = self._hex_to_lab(hex2)
-            return delta_e_cie2000(
-                self._get_lab_values(lab1),
-                self._get_lab_values(lab2)
-        )
+            return delta_e_cie2000(self._hex_to_lab(hex1), self._hex_to_lab(hex2))
         except Exception as e:
             self.logger.error(f"Delta-E calculation failed: {e}")
             return 100.0  # Max difference on error
 
-    async def _cluster_artwork_colors(self, artworks, n_clusters=5):
+    async def _cluster_artwork_colors(self, context, n_clusters=5):
         """Cluster artwork colors using perceptual difference"""
         try:
-            # Collect all dominant colors
+            # Collect all dominant colors (palettes are already sorted by rank)
             all_colors = []
-            for artwork in artworks:
-                palette = await self.db.get_artwork_palette(artwork['id'])
+            all_labs = []
+            for artwork in context.artworks:
+                palette = context.palette(artwork['id'])
                 if palette:
-                    dominant = sorted(palette, key=lambda x: x['dominance_rank'])[:3]
-                    all_colors.extend([color['hex_code'] for color in dominant])
+                    all_colors.extend([color['hex_code'] for color in palette[:3]])
+                    all_labs.extend(context.labs(artwork['id'])[:3])
             
             if len(all_colors) < n_clusters:
                 return []
 
-            # Convert to LAB space for clustering
-            lab_data = np.array([
-                self._get_lab_values(self._hex_to_lab(hex_color))
-                for hex_color in all_colors
-            ])
+            # LAB space for clustering (stored values, no conversion)
+            lab_data = np.array(all_labs)
 
             # Perform clustering
             kmeans = KMeans(
@@ -441,22 +414,14 @@ class MoodyBot(commands.Cog):
             # Build cluster info
             clusters = []
             for i in range(kmeans.n_clusters):
-                cluster_colors = [
-                    all_colors[j] 
-                    for j in range(len(all_colors)) 
-                    if kmeans.labels_[j] == i
-                ]
+                members = [j for j in range(len(all_colors)) if kmeans.labels_[j] == i]
+                cluster_colors = [all_colors[j] for j in members]
                 
                 if cluster_colors:
                     # Find closest color to center
-                    center_lab = LabColor(*kmeans.cluster_centers_[i])
-                    closest_color = min(
-                        cluster_colors,
-                        key=lambda x: self._calculate_delta_e(
-                            x, 
-                            convert_color(center_lab, sRGBColor).get_rgb_hex()
-                        )
-                    )
+                    center_lab = tuple(kmeans.cluster_centers_[i])
+                    closest = min(members, key=lambda j: delta_e_cie2000(all_labs[j], center_lab))
+                    closest_color = all_colors[closest]
                     
                     clusters.append({
                         'center': center_lab,
@@ -471,25 +436,36 @@ class MoodyBot(commands.Cog):
             self.logger.error(f"Clustering failed: {e}")
             return []
 
-    def _color_in_cluster(self, hex_color, cluster, threshold=15.0):
-        """Check if color belongs to a cluster"""
+    def _color_in_cluster(self, hex_color, cluster, threshold=15.0, lab=None):
+        """Check if color belongs to a cluster (pass lab to skip the hex conversion)"""
         try:
-            color_lab = self._hex_to_lab(hex_color)
-            center_lab = cluster['center']
-
-            # Convert LabColor objects to (L, a, b) tuples
-            lab1 = self._get_lab_values(color_lab)
-            lab2 = self._get_lab_values(center_lab)
-
-            delta_e = delta_e_cie2000(lab1, lab2)
+            if lab is None:
+                lab = self._hex_to_lab(hex_color)
+            delta_e = delta_e_cie2000(lab, cluster['center'])
             return delta_e < threshold
 
         except Exception as e:
             self.logger.error(f"Cluster check failed: {e}")
             return False
+    async def _send_embeds(self, ctx, embeds):
+        """Send embeds packed up to 10 per message (and under Discord's 6000 char total)
+
+        Returns the sent messages in order.
+        """
+        messages = []
+        batch = []
+        for embed in embeds:
+            if batch and (len(batch) == 10 or sum(len(e) for e in batch) + len(embed) > 6000):
+                messages.append(await ctx.send(embeds=batch))
+                batch = []
+            batch.append(embed)
+        if batch:
+            messages.append(await ctx.send(embeds=batch))
+        return messages
+
     async def _get_proxied_urls(self, ctx, artworks):
         """Send embeds for ranked artwork images and retrieve proxied URLs."""
-        proxied_urls = []
+        embeds = []
         for i, artwork in enumerate(artworks, 1):
             embed = discord.Embed(
                 title=f"Top #{i}: {artwork['artwork'].get('title', 'Untitled')}",
@@ -503,11 +479,13 @@ class MoodyBot(commands.Cog):
                 inline=False
             )
             embed.set_footer(text=f"Artwork ID: {artwork['artwork']['id']}")
-            message = await ctx.send(embed=embed)
+            embeds.append(embed)
 
-            # Extract proxied URL from the embed
-            if message.embeds and message.embeds[0].image:
-                proxied_urls.append(message.embeds[0].image.url)
+        # Extract proxied URLs from the sent embeds (None where Discord dropped an image)
+        proxied_urls = []
+        for message in await self._send_embeds(ctx, embeds):
+            for sent in message.embeds:
+                proxied_urls.append(sent.image.url if sent.image else None)
 
         return proxied_urls
     @commands.command(name='art')
@@ -528,6 +506,7 @@ class MoodyBot(commands.Cog):
             if not artworks:
                 return await ctx.send("No artworks found!")
 
+            embeds = []
             for art in artworks:
                 embed = discord.Embed(
                     title=art.get('title', 'Untitled'),
@@ -550,7 +529,9 @@ class MoodyBot(commands.Cog):
                         inline=False
                     )
                 embed.set_footer(text=f'Artwork ID: {art["id"]}')
-                await ctx.send(embed=embed)
+                embeds.append(embed)
+
+            await self._send_embeds(ctx, embeds)
 
         except Exception as e:
             await ctx.send(f"Error fetching artwork: {str(e)}")
@@ -559,28 +540,31 @@ class MoodyBot(commands.Cog):
     async def show_palette_overlap(self, ctx, *, theme: str):
         """Show artworks with consistent color palette overlaps."""
         try:
-            # Get artworks with theme tag
-            theme_artworks = await self.db.get_artworks_by_tag(theme.lower())
-            if not theme_artworks:
+            # Load artworks, palettes and LAB values once for every stage below
+            context = await ThemeContext.load(self.db, theme.lower())
+            if not context.artworks:
                 return await ctx.send(f"❌ No artworks found with '{theme}' tag")
 
             # Cluster colors
-            color_clusters = await self._cluster_artwork_colors(theme_artworks)
+            color_clusters = await self._cluster_artwork_colors(context)
             if not color_clusters:
                 return await ctx.send(f"❌ No color patterns found for '{theme}'")
 
+            # Ties on cluster matches go to the artwork closest to the theme's overall color mix
+            similarity = await self._theme_histogram_similarity(theme.lower())
+
             # Score artworks by cluster matches
             scored_artworks = []
-            for artwork in theme_artworks:
-                palette = await self.db.get_artwork_palette(artwork['id'])
+            for artwork in context.artworks:
+                palette = context.palette(artwork['id'])
                 if not palette:
                     continue
 
                 matches = 0
                 matched_colors = []
-                for color in palette:
+                for color, lab in zip(palette, context.labs(artwork['id'])):
                     for cluster in color_clusters:
-                        if self._color_in_cluster(color['hex_code'], cluster):
+                        if self._color_in_cluster(color['hex_code'], cluster, lab=lab):
                             matches += 1
                             matched_colors.append(color['hex_code'])
                             break
@@ -589,11 +573,14 @@ class MoodyBot(commands.Cog):
                     scored_artworks.append({
                         'artwork': artwork,
                         'score': matches,
+                        'similarity': similarity.get(artwork['id'], 0.0),
                         'matched_colors': matched_colors
                     })
 
             # Sort and get top matches
-            top_artworks = sorted(scored_artworks, key=lambda x: x['score'], reverse=True)[:5]
+            top_artworks = sorted(
+                scored_artworks, key=lambda x: (x['score'], x['similarity']), reverse=True
+            )[:5]
             if not top_artworks:
                 return await ctx.send("❌ No artworks matched the color clusters")
 
@@ -629,37 +616,26 @@ class MoodyBot(commands.Cog):
             await ctx.send(f"❌ Error: {str(e)}")
             self.logger.error(f"Palette overlap error: {traceback.format_exc()}")
 
+    async def _theme_histogram_similarity(self, theme):
+        """Histogram intersection (0-1) of each artwork in a theme with the theme's mean Lab histogram"""
+        artwork_ids, histograms = await self.db.get_theme_histograms(theme)
+        if not artwork_ids:
+            return {}
+        mean = np.round(histograms.mean(axis=0)).astype(HISTOGRAM_DTYPE)
+        return dict(zip(artwork_ids, histogram_intersection(mean, histograms).tolist()))
+
     async def _generate_overlap_comparison(self, artworks, clusters):
         """Generate visual comparison of palette overlaps"""
-        from matplotlib import pyplot as plt
-        
-        # Create figure
-        fig, ax = plt.subplots(figsize=(12, 8))
-        
-        # Plot cluster centers
-        for i, cluster in enumerate(clusters[:5]):
-            for j, color in enumerate(cluster['representative_colors'][:3]):
-                ax.scatter(
-                    i, j,
-                    color=color,
-                    s=300,
-                    edgecolors='white'
-                )
-        
-        # Plot artwork matches
-        for aw_idx, artwork in enumerate(artworks[:5]):
-            # Get artwork image thumbnail
-            img = await self._get_image_thumbnail(artwork['artwork']['image_url'])
-            
-            # Plot image
-            ax.imshow(
-                img,
-                extent=(aw_idx-0.4, aw_idx+0.4, -2, -1),
-                aspect='auto',
-                zorder=0
-            )
-            
-            # Plot matched colors
+        artworks = artworks[:5]
+
+        # Get artwork image thumbnails (concurrently, placeholders on failure)
+        thumbnails = await self._fetch_thumbnails(
+            [(artwork['artwork']['image_url'], artwork['artwork']['id']) for artwork in artworks]
+        )
+
+        # Match lines may point at any cluster, not just the five drawn
+        connections = []
+        for aw_idx, artwork in enumerate(artworks):
             for color in artwork['matched_colors'][:5]:
                 closest_cluster = next(
                     (i for i, cluster in enumerate(clusters) 
@@ -667,70 +643,19 @@ class MoodyBot(commands.Cog):
                     -1
                 )
                 if closest_cluster >= 0:
-                    ax.plot(
-                        [aw_idx, closest_cluster],
-                        [-0.5, 0],
-                        color=color,
-                        linewidth=2,
-                        alpha=0.7
-                    )
-        
-        ax.set_xlim(-1, max(5, len(artworks)))
-        ax.set_ylim(-2.5, 2.5)
-        ax.axis('off')
-        ax.set_title('Color Palette Overlap Analysis', pad=20)
-        
-        # Save to buffer
-        buffer = io.BytesIO()
-        plt.savefig(buffer, format='png', bbox_inches='tight', dpi=120)
-        plt.close()
-        buffer.seek(0)
-        return buffer
+                    connections.append((aw_idx, closest_cluster, color))
 
-    async def _get_image_thumbnail(self, url, size=(200, 200)):
-        """Download and resize image for visualization"""
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                img_data = await response.read()
-        
-        with Image.open(io.BytesIO(img_data)) as img:
-            img.thumbnail(size)
-            return img
+        png = await self.renderer.render(
+            'overlap_comparison', clusters, thumbnails, connections, len(artworks)
+        )
+        return io.BytesIO(png)
+
+    async def _get_image_thumbnail(self, url, size=(200, 200), artwork_id=None):
+        """Download and resize image for visualization (cached per artwork)"""
+        return await self._download_image(url, size=size, artwork_id=artwork_id)
     async def _generate_color_relationship_moodboard(self, artworks):
         """Generate moodboard showing color relationships"""
-        # Create color relationship visualization
-        fig, ax = plt.subplots(figsize=(10, 6))
-        
-        # Plot reference color and matches
-        for artwork in artworks:
-            for match in artwork['best_matches']:
-                color = match['hex']
-                delta_e = match['delta_e']
-                
-                # Convert to RGB for display
-                rgb = tuple(int(color.lstrip('#')[i:i+2], 16) for i in (0, 2, 4))
-                rgb = tuple(c/255 for c in rgb)
-                
-                # Plot with size based on similarity
-                size = max(1, 100 - delta_e) * 10
-                ax.scatter(
-                    delta_e, 
-                    artwork['score'], 
-                    c=[rgb],
-                    s=size,
-                    alpha=0.7
-                )
-        
-        ax.set_xlabel('Color Difference (ΔE)')
-        ax.set_ylabel('Match Score')
-        ax.set_title('Color Relationship Analysis')
-        
-        # Save to buffer
-        buffer = io.BytesIO()
-        plt.savefig(buffer, format='png', bbox_inches='tight')
-        plt.close()
-        buffer.seek(0)
-        return buffer
+        return io.BytesIO(await self.renderer.render('relationship_scatter', artworks))
             
     def generate_moodboard(self, colors: list, width=600, height=300) -> io.BytesIO:
         """Generate a stylish moodboard image"""
@@ -792,8 +717,11 @@ class MoodyBot(commands.Cog):
             raise e
     
     @commands.command(name='showpalette', aliases=['palette', 'colors'])
-    async def show_palette(self, ctx):
-        """Display color palette by replying to an artwork message"""
+    async def show_palette(self, ctx, index: int = 1):
+        """Display color palette by replying to an artwork message
+
+        Messages can carry several artworks; pass a number to pick one (default: first).
+        """
         try:
             # Check if it's a reply
             if not ctx.message.reference:
@@ -802,15 +730,15 @@ class MoodyBot(commands.Cog):
             # Get the referenced message
             ref_msg = await ctx.channel.fetch_message(ctx.message.reference.message_id)
         
-            # Extract artwork ID from embed (assuming your embeds include it)
-            artwork_id = None
+            # Extract artwork IDs from embeds (assuming your embeds include them)
+            artwork_ids = []
             for embed in ref_msg.embeds:
                 if embed.footer and embed.footer.text:
                     # Try extracting ID from footer (e.g., "Artwork ID: 123")
                     match = re.search(r"Artwork ID: (\d+)", embed.footer.text)
                     if match:
-                        artwork_id = int(match.group(1))
-                        break
+                        artwork_ids.append(int(match.group(1)))
+            artwork_id = artwork_ids[index - 1] if 0 < index <= len(artwork_ids) else None
         
             if not artwork_id:
                 return await ctx.send("❌ Couldn't find artwork ID in the replied message")
@@ -846,32 +774,158 @@ class MoodyBot(commands.Cog):
         
         except Exception as e:
             await ctx.send(f"❌ Error generating palette: {str(e)}")
-    @commands.command(name='artist')
-    async def show_artworks(self, ctx, artist_name: str, page: int = 1):
-        """Display artworks with their tags"""
+
+    @commands.command(name='color', aliases=['colour'])
+    async def find_color(self, ctx, hex_color: str, max_delta_e: float = None):
+        """Find artworks using a color: !color #3A5F8C [max ΔE]
+
+        Without max ΔE, shows the five closest artworks; with it, up to five
+        artworks whose palette has a color within that CIEDE2000 distance.
+        """
         try:
-            per_page = 5
-            offset = (page - 1) * per_page
+            match = re.fullmatch(r"#?([0-9a-fA-F]{6})", hex_color.strip())
+            if not match:
+                return await ctx.send("❌ Please give a color as a hex code, e.g. `!color #3A5F8C`")
+            hex_color = f"#{match.group(1).upper()}"
+
+            if not self.db.color_index.loaded:
+                await self.db.refresh_color_index()
+            if max_delta_e is None:
+                matches = self.db.color_index.nearest(hex_color, k=5)
+            else:
+                matches = self.db.color_index.radius(hex_color, max_delta_e, limit=5)
+            if not matches:
+                return await ctx.send(f"No artworks found with a color close to `{hex_color}`")
+
+            artworks = {
+                art['id']: art
+                for art in await self.db.get_artworks_by_ids([hit['artwork_id'] for hit in matches])
+            }
+            embeds = []
+            for hit in matches:
+                art = artworks.get(hit['artwork_id'])
+                if not art:
+                    continue
+                embed = discord.Embed(
+                    title=art.get('title') or 'Untitled',
+                    description=(f"`{hit['hex']}` is ΔE {hit['delta_e']:.1f} from `{hex_color}` "
+                                 f"and covers {hit['coverage']:.0f}% of the image"),
+                    color=int(hit['hex'].lstrip('#'), 16)
+                )
+                if art.get('image_url'):
+                    embed.set_image(url=art['image_url'])
+                if art.get('artist_name'):
+                    embed.set_author(name=f"Artist: {art['artist_name']}")
+                embed.set_footer(text=f'Artwork ID: {art["id"]}')
+                embeds.append(embed)
 
-            # Get artist
-            artist = await self.db.get_or_create_artist(
-                artist_name=artist_name,
-                social_media_link=""
-            )
+            await self._send_embeds(ctx, embeds)
 
-            # Get artworks
-            artworks = await self.db.get_artworks_by_artist(
-                artist_id=artist['id'],
-                limit=per_page,
-                offset=offset
+        except Exception as e:
+            self.logger.error(f"Color search error: {e}", exc_info=True)
+            await ctx.send(f"❌ Color search failed: {str(e)}")
+
+    @commands.command(name='cachestats')
+    @commands.is_owner()
+    async def show_cache_stats(self, ctx):
+        """Hit rates of the palette and identity caches (bot owner only)"""
+        caches = {'palettes': self.analyzer.cache_stats(), **self.db.identity_cache_stats()}
+        lines = [
+            f"**{name}**: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%})"
+            for name, stats in caches.items()
+        ]
+        await ctx.send("\n".join(lines))
+
+    def _page_cursor(self, artist_id, artworks):
+        """Footer token carrying the (created_at, id) keys of a page's first and last rows"""
+        first, last = artworks[0], artworks[-1]
+        return (f"{artist_id}:{first['created_at']:%Y%m%d%H%M%S}.{first['id']}"
+                f"~{last['created_at']:%Y%m%d%H%M%S}.{last['id']}")
+
+    async def _replied_page_cursor(self, ctx):
+        """(page, artist_id, first_key, last_key) from the !artist page being replied to"""
+        if not ctx.message.reference:
+            return None
+        ref_msg = await ctx.channel.fetch_message(ctx.message.reference.message_id)
+        for embed in ref_msg.embeds:
+            if not (embed.footer and embed.footer.text):
+                continue
+            match = re.search(
+                r"Page (\d+) \| Cursor (\d+):(\d{14})\.(\d+)~(\d{14})\.(\d+)", embed.footer.text
             )
+            if match:
+                page, artist_id, first_ts, first_id, last_ts, last_id = match.groups()
+                parse = lambda ts: datetime.strptime(ts, '%Y%m%d%H%M%S')
+                return (int(page), int(artist_id),
+                        (parse(first_ts), int(first_id)), (parse(last_ts), int(last_id)))
+        return None
 
-            if not artworks:
-                return await ctx.send(f"No artworks found for {artist_name}")
+    @commands.command(name='artist')
+    async def show_artworks(self, ctx, artist_name: str, page: Optional[str] = None):
+        """Display artworks with their tags
 
+        !artist <name> [page] jumps to a page; replying to a page with
+        !artist next / !artist prev follows its footer cursor (constant cost).
+        next/prev only act as directions in a reply to an !artist page, so
+        artists called "Next" or "Prev" can still be looked up.
+        """
+        try:
+            per_page = 5
+            direction = None
+            if page is not None and page.lower() in ('next', 'prev'):
+                direction = page.lower()
+            elif page is None and artist_name.lower() in ('next', 'prev') and ctx.message.reference:
+                direction = artist_name.lower()
+
+            cursor = await self._replied_page_cursor(ctx) if direction else None
+            if direction and not cursor and page is not None:
+                return await ctx.send("❌ Reply to an !artist page to use next/prev")
+            if not cursor:
+                # Not a reply to an !artist page: "next"/"prev" is the artist's name
+                direction = None
+
+            if direction:
+                page, artist_id, first_key, last_key = cursor
+                if direction == 'prev' and page <= 1:
+                    return await ctx.send("Already on the first page")
+
+                # Keyset seek from the replied page's boundary rows
+                if direction == 'next':
+                    page += 1
+                    artworks = await self.db.get_artist_artworks_with_tags(
+                        artist_id=artist_id, limit=per_page, after=last_key
+                    )
+                else:
+                    page -= 1
+                    artworks = await self.db.get_artist_artworks_with_tags(
+                        artist_id=artist_id, limit=per_page, before=first_key
+                    )
+                if not artworks:
+                    return await ctx.send("No more artworks")
+            else:
+                page = int(page or 1)
+                offset = (page - 1) * per_page
+
+                # Get artist (read-only: typos must not create artists)
+                artist = await self.db.get_artist_by_name(artist_name)
+                if not artist:
+                    return await ctx.send(f"No artworks found for {artist_name}")
+                artist_id = artist['id']
+
+                # Get artworks with their tags in one query
+                artworks = await self.db.get_artist_artworks_with_tags(
+                    artist_id=artist_id,
+                    limit=per_page,
+                    offset=offset
+                )
+
+                if not artworks:
+                    return await ctx.send(f"No artworks found for {artist_name}")
+
+            cursor_token = self._page_cursor(artist_id, artworks)
+            embeds = []
             for art in artworks:
-                # Fetch tags for this artwork
-                tags = await self.db.get_artwork_tags(art['id'])
+                tags = art['tags'].split(',') if art.get('tags') else []
             
                 # Create embed
                 embed = discord.Embed(
@@ -889,8 +943,10 @@ class MoodyBot(commands.Cog):
                         inline=False
                     )
             
-                embed.set_footer(text=f'Artwork ID: {art["id"]} | Page {page}')
-                await ctx.send(embed=embed)
+                embed.set_footer(text=f'Artwork ID: {art["id"]} | Page {page} | Cursor {cursor_token}')
+                embeds.append(embed)
+
+            await self._send_embeds(ctx, embeds)
 
         except Exception as e:
             await ctx.send(f"Error displaying artworks: {str(e)}")
@@ -0,0 +1,106 @@
+"""Compare palette extractor engines for speed and agreement
+
+    python benchmark_palettes.py [image_dir] [--engines kmeans,colorthief] [--repeat 3]
+
+Without image_dir a fixed set of synthetic fixtures (flat blocks,
+gradients, noise) is generated. For every engine after the first
+(the baseline), agreement is the mean CIEDE2000 distance from each
+baseline color to its nearest color in the engine's palette, plain and
+weighted by the baseline's coverage.
+"""
+import argparse
+import pathlib
+import time
+from typing import Dict, List
+
+import numpy as np
+from PIL import Image
+
+from _delta_e import delta_e_cie2000_matrix, rgb_to_lab_batch
+from lib.analyser import MAX_ANALYSIS_SIDE
+from lib.extractors import EXTRACTORS
+
+
+def synthetic_fixtures() -> Dict[str, Image.Image]:
+    rng = np.random.default_rng(7)
+    fixtures = {}
+
+    blocks = np.zeros((480, 640, 3), np.uint8)
+    for i, color in enumerate([(200, 30, 30), (20, 40, 220), (250, 250, 250), (30, 160, 60), (240, 200, 40)]):
+        blocks[:, i * 128:(i + 1) * 128] = color
+    fixtures['blocks'] = Image.fromarray(blocks)
+
+    x = np.linspace(0, 1, 640)[None, :, None]
+    y = np.linspace(0, 1, 480)[:, None, None]
+    gradient = (np.concatenate([x.repeat(480, 0), y.repeat(640, 1), (1 - x) * y], axis=2) * 255)
+    fixtures['gradient'] = Image.fromarray(gradient.astype(np.uint8))
+
+    fixtures['noise'] = Image.fromarray(rng.integers(0, 256, (480, 640, 3), dtype=np.uint8))
+
+    centers = rng.integers(0, 256, (6, 3))
+    labels = rng.integers(0, 6, (60, 80)).repeat(8, 0).repeat(8, 1)
+    jitter = rng.normal(0, 12, (480, 640, 3))
+    fixtures['clusters'] = Image.fromarray(np.clip(centers[labels] + jitter, 0, 255).astype(np.uint8))
+    return fixtures
+
+
+def load_fixtures(directory: pathlib.Path) -> Dict[str, Image.Image]:
+    fixtures = {}
+    for path in sorted(directory.iterdir()):
+        try:
+            image = Image.open(path)
+            image.draft('RGB', (MAX_ANALYSIS_SIDE, MAX_ANALYSIS_SIDE))
+            image.thumbnail((MAX_ANALYSIS_SIDE, MAX_ANALYSIS_SIDE))
+            fixtures[path.name] = image.convert('RGBA')
+        except OSError:
+            continue
+    return fixtures
+
+
+def agreement(baseline: List, other: List) -> tuple:
+    """Mean and coverage-weighted mean nearest-color CIEDE2000 from baseline to other"""
+    labs1 = rgb_to_lab_batch(np.array([rgb for rgb, _ in baseline], dtype=float))
+    labs2 = rgb_to_lab_batch(np.array([rgb for rgb, _ in other], dtype=float))
+    nearest = delta_e_cie2000_matrix(labs1, labs2).min(axis=1)
+    weights = np.array([share for _, share in baseline])
+    return float(nearest.mean()), float((nearest * weights).sum() / max(weights.sum(), 1e-9))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('image_dir', nargs='?', type=pathlib.Path)
+    parser.add_argument('--engines', default='colorthief,kmeans')
+    parser.add_argument('--colors', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    engines = args.engines.split(',')
+    fixtures = load_fixtures(args.image_dir) if args.image_dir else synthetic_fixtures()
+    timings = {engine: [] for engine in engines}
+    scores = {engine: [] for engine in engines[1:]}
+
+    print(f"{'image':<20}" + ''.join(f"{engine + ' ms':>16}" for engine in engines)
+          + ''.join(f"{engine + ' dE/wdE':>22}" for engine in engines[1:]))
+    for name, image in fixtures.items():
+        palettes = {}
+        for engine in engines:
+            extractor = EXTRACTORS[engine]
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                palettes[engine] = extractor(image, color_count=args.colors)
+            timings[engine].append((time.perf_counter() - start) / args.repeat * 1000)
+
+        row = f"{name[:19]:<20}" + ''.join(f"{timings[engine][-1]:>16.1f}" for engine in engines)
+        for engine in engines[1:]:
+            mean, weighted = agreement(palettes[engines[0]], palettes[engine])
+            scores[engine].append((mean, weighted))
+            row += f"{mean:>14.2f} / {weighted:>5.2f}"
+        print(row)
+
+    print(f"{'mean':<20}" + ''.join(f"{np.mean(timings[engine]):>16.1f}" for engine in engines)
+          + ''.join(f"{np.mean([s[0] for s in scores[engine]]):>14.2f} / {np.mean([s[1] for s in scores[engine]]):>5.2f}"
+                    for engine in engines[1:]))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,63 +1,186 @@
-from colorthief import ColorThief
+from PIL import Image
 from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
+from lib.http_client import HttpClient
+from lib.extractors import get_extractor, image_pixels, lab_histogram
 import aiohttp
+import asyncio
+import hashlib
 import logging
-from typing import List, Dict
+import os
+from typing import List, Dict, Optional, Tuple
+
+MAX_IMAGE_BYTES = 5 * 1024 * 1024  # 5MB download cap
+MAX_ANALYSIS_SIDE = 512  # Longest edge (px) analysed; bounds pixels per palette
+
+
+def _rgb_to_hex(rgb: tuple) -> str:
+    """Convert RGB to hex with validation"""
+    if len(rgb) != 3 or not all(0 <= c <= 255 for c in rgb):
+        raise ValueError("Invalid RGB values")
+    return "#{:02X}{:02X}{:02X}".format(*rgb)
+
+
+def _decode_reduced(buffer: BytesIO, max_side: int = MAX_ANALYSIS_SIDE) -> Image.Image:
+    """Decode an image at reduced resolution so at most max_side^2 pixels are analysed"""
+    image = Image.open(buffer)
+    # JPEG: let the decoder scale by 1/2..1/8 while decoding (no-op for other formats)
+    image.draft('RGB', (max_side, max_side))
+    # thumbnail() uses Image.reduce() where the format supports it before resampling
+    image.thumbnail((max_side, max_side))
+    return image
+
+
+def analyse_image_bytes(image_data: bytes, color_count: int = 5, engine: Optional[str] = None) -> Tuple[List[Dict], bytes]:
+    """Decode image bytes once; return its palette and Lab histogram BLOB (CPU bound)
+
+    percentage is the share of the image's opaque pixels nearest to each
+    color, and colors come most dominant first. The histogram is
+    lib.extractors.lab_histogram serialised as little-endian uint16s.
+    """
+    extractor = get_extractor(engine)
+    with BytesIO(image_data) as buffer:
+        image = _decode_reduced(buffer)
+        palette = extractor(image, color_count=color_count)
+        histogram = lab_histogram(image_pixels(image)).tobytes()
+
+    return [
+        {
+            "hex": _rgb_to_hex(color),
+            "percentage": round(share * 100, 1)
+        }
+        for color, share in palette
+    ], histogram
+
 
 class ColorAnalyser:
-    def __init__(self):
-        self.http = None  # Initialize as None
-        self.timeout = aiohttp.ClientTimeout(total=30)
+    """Downloads artwork images and extracts their palettes
+
+    mode 'process' (default) runs extraction in a ProcessPoolExecutor with
+    max_workers processes and at most max_in_flight jobs queued, so image
+    decoding never blocks the event loop. mode 'inline' runs it in the
+    coroutine as before. Each setting falls back to an environment variable:
+    PALETTE_EXTRACTION_MODE, PALETTE_WORKERS, PALETTE_MAX_IN_FLIGHT.
+
+    engine picks the extractor from lib.extractors.EXTRACTORS ('kmeans',
+    the default, or 'colorthief'), falling back to PALETTE_ENGINE.
+
+    palette_cache, if given (MySQLStorage), is consulted by SHA-256 of the
+    downloaded bytes so identical images are only ever analysed once.
+
+    http_client is the shared HttpClient owned by the cog; without one the
+    analyser creates (and closes) its own.
+    """
+    def __init__(self, mode: Optional[str] = None, max_workers: Optional[int] = None,
+                 max_in_flight: Optional[int] = None, palette_cache=None,
+                 http_client: Optional[HttpClient] = None, engine: Optional[str] = None):
+        self._owns_http = http_client is None
+        self.http = http_client or HttpClient()
         self.logger = logging.getLogger(__name__)
+        self.mode = mode or os.getenv('PALETTE_EXTRACTION_MODE', 'process')
+        self.max_workers = max_workers or int(os.getenv('PALETTE_WORKERS', '2'))
+        self.max_in_flight = max_in_flight or int(os.getenv('PALETTE_MAX_IN_FLIGHT', '4'))
+        self.engine = engine or os.getenv('PALETTE_ENGINE', 'kmeans')
+        get_extractor(self.engine)  # Fail fast on an unknown engine name
+        self._executor = None
+        self._in_flight = asyncio.Semaphore(self.max_in_flight)
+        self.palette_cache = palette_cache
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.stats_log_interval = 100  # Log cache_stats() every this many lookups
+
+    def _ensure_executor(self) -> ProcessPoolExecutor:
+        """Lazy initialization of the extraction process pool"""
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    async def _run_extraction(self, image_data: bytes) -> Tuple[List[Dict], bytes]:
+        """Run palette and histogram extraction according to the configured mode"""
+        if self.mode != 'process':
+            return analyse_image_bytes(image_data, engine=self.engine)
+
+        async with self._in_flight:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._ensure_executor(), analyse_image_bytes, image_data, 5, self.engine
+            )
 
-    async def ensure_session(self):
-        """Lazy initialization of HTTP session"""
-        if self.http is None or self.http.closed:
-            self.http = aiohttp.ClientSession(timeout=self.timeout)
     async def extract_palettes(self, image_url: str):
-        await self.ensure_session()
+        return (await self.analyse(image_url))['palette']
+
+    async def analyse(self, image_url: str) -> Dict:
+        """Download an image and return {'palette': [...], 'histogram': bytes}"""
         try:
-            async with self.http.get(image_url, timeout=self.timeout) as response:
-                response.raise_for_status()
-                image_data = await response.read()
-            
-            # Add manual size check
-                if len(image_data) > 5 * 1024 * 1024:  # 5MB
-                    raise ValueError("Image too large")
-            
-                with BytesIO(image_data) as buffer:
-                    color_thief = ColorThief(buffer)
-                    palette = color_thief.get_palette(color_count=5, quality=10)
-                        
-                    total = sum(sum(color) for color in palette) or 1
-                    return [
-                            {
-                                "hex": self._rgb_to_hex(color),
-                                "percentage": round(sum(color)/total * 100, 1)
-                            }
-                            for color in palette
-                        ]
-        except Exception as e:
-            raise ValueError(f"Color analysis failed: {str(e)}")
+            # Streamed under the size cap through the shared HTTP client
+            image_data = await self.http.get_bytes(image_url, max_bytes=MAX_IMAGE_BYTES)
+            if self.palette_cache is None:
+                palette, histogram = await self._run_extraction(image_data)
+                return {'palette': palette, 'histogram': histogram}
+
+            # Keyed by engine too, so switching engines never serves the other's palettes
+            content_hash = hashlib.sha256(self.engine.encode() + b'\0' + image_data).hexdigest()
+            cached = await self._cached_analysis(content_hash)
+            if cached and cached['histogram']:
+                self.cache_hits += 1
+                self._maybe_log_cache_stats()
+                return cached
+
+            self.cache_misses += 1
+            self._maybe_log_cache_stats()
+            palette, histogram = await self._run_extraction(image_data)
+            try:
+                await self.palette_cache.cache_palette(content_hash, palette, histogram)
+            except Exception as e:
+                self.logger.warning(f"Palette cache write failed: {e}")
+            return {'palette': palette, 'histogram': histogram}
 
         except aiohttp.ClientError as e:
             self.logger.error(f"Network error: {e}")
             raise ConnectionError("Failed to download image")
         except Exception as e:
             self.logger.error(f"Analysis error: {e}")
-            raise
+            raise ValueError(f"Color analysis failed: {str(e)}")
+
+    async def _cached_analysis(self, content_hash: str) -> Optional[Dict]:
+        """Cache lookup that degrades to a miss if the cache is unavailable"""
+        try:
+            return await self.palette_cache.get_cached_analysis(content_hash)
+        except Exception as e:
+            self.logger.warning(f"Palette cache lookup failed: {e}")
+            return None
+
+    def cache_stats(self) -> Dict[str, float]:
+        """Hit/miss counters for the content-addressed palette cache"""
+        lookups = self.cache_hits + self.cache_misses
+        return {
+            'hits': self.cache_hits,
+            'misses': self.cache_misses,
+            'hit_rate': self.cache_hits / lookups if lookups else 0.0
+        }
 
     @staticmethod
     def _rgb_to_hex(rgb: tuple) -> str:
         """Convert RGB to hex with validation"""
-        if len(rgb) != 3 or not all(0 <= c <= 255 for c in rgb):
-            raise ValueError("Invalid RGB values")
-        return "#{:02X}{:02X}{:02X}".format(*rgb)
+        return _rgb_to_hex(rgb)
+
+    def _maybe_log_cache_stats(self) -> None:
+        if (self.cache_hits + self.cache_misses) % self.stats_log_interval == 0:
+            self.log_cache_stats()
+
+    def log_cache_stats(self) -> None:
+        stats = self.cache_stats()
+        self.logger.info(
+            f"Palette cache: {stats['hits']} hits, {stats['misses']} misses "
+            f"({stats['hit_rate']:.0%} hit rate)"
+        )
 
     async def close(self):
         """Proper resource cleanup"""
-        if self.http and not self.http.closed:
+        if self.palette_cache is not None:
+            self.log_cache_stats()
+        if self._owns_http:
             await self.http.close()
-            self.http = None
-
-
+        if self._executor is not None:
+            executor, self._executor = self._executor, None
+            await asyncio.to_thread(executor.shutdown, wait=True, cancel_futures=True)
@@ -0,0 +1,100 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+
+
+class WriteBatcher:
+    """Write-behind coalescing of INSERTs from concurrent submissions
+
+    Rows added for the same statement within max_delay seconds (or until
+    max_rows are queued) are flushed together in one executemany call, which
+    PyMySQL sends as a single multi-row INSERT, and one commit. add() waits
+    for the flush, so callers still see failures and latency is bounded by
+    max_delay plus one round trip. If a shared flush fails, each add() is
+    retried in its own transaction so only the requests whose rows are bad
+    fail. close() flushes anything pending.
+    """
+    def __init__(self, storage, max_delay: float = 0.05, max_rows: int = 500):
+        self.storage = storage
+        self.max_delay = max_delay
+        self.max_rows = max_rows
+        self.logger = logging.getLogger(__name__)
+        self._pending: Dict[str, List[Tuple[list, asyncio.Future]]] = {}
+        self._pending_rows = 0
+        self._timer: Optional[asyncio.Task] = None
+        self._flushes: set = set()
+
+    async def add(self, query: str, rows: list) -> None:
+        """Queue rows for query and wait until they are committed"""
+        if not rows:
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._pending.setdefault(query, []).append((rows, future))
+        self._pending_rows += len(rows)
+
+        if self._pending_rows >= self.max_rows:
+            self._start_flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+        await future
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.max_delay)
+        self._timer = None
+        self._start_flush()
+
+    def _start_flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending, self._pending_rows = self._pending, {}, 0
+        if batch:
+            task = asyncio.create_task(self._flush(batch))
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+
+    async def _write(self, batch: Dict[str, List[Tuple[list, asyncio.Future]]]):
+        """executemany every query's rows on one connection and commit once"""
+        async with self.storage.pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                try:
+                    for query, entries in batch.items():
+                        await cursor.executemany(query, [row for rows, _ in entries for row in rows])
+                    await conn.commit()
+                except Exception:
+                    await conn.rollback()
+                    raise
+
+    async def _flush(self, batch: Dict[str, List[Tuple[list, asyncio.Future]]]):
+        entries = [(query, rows, future) for query, queued in batch.items() for rows, future in queued]
+        try:
+            await self._write(batch)
+        except Exception as e:
+            if len(entries) == 1:
+                self.logger.error(f"Batched write failed: {e}")
+                if not entries[0][2].done():
+                    entries[0][2].set_exception(e)
+                return
+            # One bad request must not fail the others; retry each in its own transaction
+            self.logger.warning(f"Batched write of {len(entries)} requests failed ({e}); retrying individually")
+            for query, rows, future in entries:
+                try:
+                    await self._write({query: [(rows, future)]})
+                except Exception as e:
+                    self.logger.error(f"Write of {len(rows)} rows failed: {e}")
+                    if not future.done():
+                        future.set_exception(e)
+                else:
+                    if not future.done():
+                        future.set_result(None)
+            return
+
+        for _, _, future in entries:
+            if not future.done():
+                future.set_result(None)
+
+    async def close(self):
+        """Flush pending rows and wait for in-flight flushes"""
+        self._start_flush()
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
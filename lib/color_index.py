@@ -0,0 +1,212 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from _delta_e import delta_e_cie2000_one_to_many, hex_to_lab
+
+_GRID = 64  # Cells per axis in the packed cell key (enough for cell_size >= 5)
+_AB_OFFSET = 160.0  # Shift a/b (about -128..128) to non-negative before bucketing
+_LAB_MIN = np.array([0.0, -128.0, -128.0])
+_LAB_MAX = np.array([100.0, 128.0, 128.0])
+
+
+class ColorIndex:
+    """In-memory uniform Lab grid over every stored palette color
+
+    Points are kept sorted by grid cell, so a query reads the cells around
+    it as contiguous slices (np.searchsorted) instead of scanning every
+    palette. Colors added since the last merge sit in a small unsorted tail
+    that is scanned directly and folded in once it reaches merge_threshold
+    entries.
+
+    Candidates are prefiltered with _weighted(), a cheap CIE94-style
+    distance that, like CIEDE2000, divides chroma and hue differences by
+    chroma-dependent weights; only those within candidate_factor times the
+    requested distance get exact CIEDE2000. On random sRGB colors that
+    ratio stays below 2.4, so the default of 2.5 loses no matches.
+    """
+    def __init__(self, cell_size: float = 10.0, candidate_factor: float = 2.5,
+                 merge_threshold: int = 4096):
+        self.cell_size = cell_size
+        self.candidate_factor = candidate_factor
+        self.merge_threshold = merge_threshold
+        self.loaded = False
+        self._clear()
+
+    def _clear(self) -> None:
+        self._keys = np.zeros(0, dtype=np.int64)
+        self._labs = np.zeros((0, 3), dtype=np.float64)
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._coverage = np.zeros(0, dtype=np.float64)
+        self._hexes = np.zeros(0, dtype='<U7')
+        self._alive = np.zeros(0, dtype=bool)
+        self._tail: List[Tuple[int, str, float, Tuple[float, float, float]]] = []
+
+    def __len__(self) -> int:
+        return int(self._alive.sum()) + len(self._tail)
+
+    def rebuild(self, rows: Iterable[Tuple[int, str, Optional[float], Tuple[float, float, float]]]) -> None:
+        """Replace the index with (artwork_id, hex, coverage, lab) rows"""
+        self._clear()
+        self._tail = [(artwork_id, hex_code, coverage or 0.0, lab) for artwork_id, hex_code, coverage, lab in rows]
+        self._merge()
+        self.loaded = True
+
+    def replace(self, artwork_id: int, colors: List[Dict]) -> None:
+        """Index an artwork's palette (as passed to complete_analysis_job), dropping any previous one"""
+        self.remove(artwork_id)
+        for color in colors or []:
+            self._tail.append((artwork_id, color['hex'], color.get('percentage') or 0.0, hex_to_lab(color['hex'])))
+        if len(self._tail) >= self.merge_threshold:
+            self._merge()
+
+    def remove(self, artwork_id: int) -> None:
+        """Drop every indexed color of an artwork"""
+        self._alive[self._ids == artwork_id] = False
+        self._tail = [entry for entry in self._tail if entry[0] != artwork_id]
+
+    def _cell(self, labs: np.ndarray) -> np.ndarray:
+        """Per-axis cell coordinates of (N, 3) LAB points"""
+        shifted = labs + np.array([0.0, _AB_OFFSET, _AB_OFFSET])
+        return np.clip(np.floor(shifted / self.cell_size), 0, _GRID - 1).astype(np.int64)
+
+    @staticmethod
+    def _pack(cells: np.ndarray) -> np.ndarray:
+        return (cells[..., 0] * _GRID + cells[..., 1]) * _GRID + cells[..., 2]
+
+    def _tail_columns(self):
+        """The unsorted tail as (labs, ids, coverage, hexes) arrays"""
+        tail_ids, tail_hexes, tail_coverage, tail_labs = zip(*self._tail)
+        return (
+            np.asarray(tail_labs, dtype=np.float64).reshape(-1, 3),
+            np.asarray(tail_ids, dtype=np.int64),
+            np.asarray(tail_coverage, dtype=np.float64),
+            np.asarray(tail_hexes, dtype='<U7')
+        )
+
+    def _merge(self) -> None:
+        """Fold the tail into the sorted arrays and drop removed entries"""
+        alive = self._alive
+        columns = (self._labs[alive], self._ids[alive], self._coverage[alive], self._hexes[alive])
+        if self._tail:
+            columns = tuple(np.concatenate(pair) for pair in zip(columns, self._tail_columns()))
+        labs, ids, coverage, hexes = columns
+
+        keys = self._pack(self._cell(labs))
+        order = np.argsort(keys, kind='stable')
+        self._keys, self._labs, self._ids = keys[order], labs[order], ids[order]
+        self._coverage, self._hexes = coverage[order], hexes[order]
+        self._alive = np.ones(len(keys), dtype=bool)
+        self._tail = []
+
+    def _candidates(self, lab: np.ndarray, reach: np.ndarray) -> np.ndarray:
+        """Row indices of live sorted points in the cells within the per-axis reach of lab"""
+        low = self._cell(np.maximum(lab - reach, _LAB_MIN)[None, :])[0]
+        high = self._cell(np.minimum(lab + reach, _LAB_MAX)[None, :])[0]
+        axes = [np.arange(low[axis], high[axis] + 1) for axis in range(3)]
+        cells = np.stack(np.meshgrid(*axes, indexing='ij'), axis=-1).reshape(-1, 3)
+        keys = self._pack(cells)
+        starts = np.searchsorted(self._keys, keys, side='left')
+        lengths = np.searchsorted(self._keys, keys, side='right') - starts
+        # Concatenate the row ranges [start, start + length) without a Python loop
+        offsets = np.cumsum(lengths) - lengths
+        rows = np.repeat(starts - offsets, lengths) + np.arange(lengths.sum())
+        return rows[self._alive[rows]]
+
+    @staticmethod
+    def _weighted(lab: np.ndarray, labs: np.ndarray) -> np.ndarray:
+        """CIE94-style distance from lab to each row of labs (the CIEDE2000 prefilter)"""
+        chroma = np.hypot(labs[:, 1], labs[:, 2])
+        query_chroma = np.hypot(lab[1], lab[2])
+        mean_chroma = (chroma + query_chroma) / 2
+        delta = labs - lab
+        delta_c = chroma - query_chroma
+        delta_h2 = np.maximum(delta[:, 1] ** 2 + delta[:, 2] ** 2 - delta_c ** 2, 0)
+        return np.sqrt(
+            delta[:, 0] ** 2
+            + (delta_c / (1 + 0.045 * mean_chroma)) ** 2
+            + delta_h2 / (1 + 0.015 * mean_chroma) ** 2
+        )
+
+    @staticmethod
+    def _reach(lab: np.ndarray, bound: float) -> np.ndarray:
+        """Per-axis (L, a, b) half-widths of a box holding every point within _weighted() bound
+
+        |dL| is at most bound. dC and dH are at most bound times their
+        weights, and the larger chroma weight peaks at a mean chroma up to
+        bound / 2 above the query's, which bounds the a/b offsets.
+        """
+        shrink = 1 - 0.0225 * bound
+        if shrink <= 0:
+            return np.array([bound, 256.0, 256.0])
+        chroma = float(np.hypot(lab[1], lab[2]))
+        ab = min(256.0, bound * np.sqrt(2) * (1 + 0.045 * chroma) / shrink)
+        return np.array([bound, ab, ab])
+
+    def _gather(self, lab: np.ndarray, bound: float):
+        """(labs, ids, coverage, hexes) of all points within _weighted() distance bound"""
+        rows = self._candidates(lab, self._reach(lab, bound))
+        rows = rows[self._weighted(lab, self._labs[rows]) <= bound]
+        columns = (self._labs[rows], self._ids[rows], self._coverage[rows], self._hexes[rows])
+        if self._tail:
+            tail = self._tail_columns()
+            within = self._weighted(lab, tail[0]) <= bound
+            columns = tuple(np.concatenate([column, extra[within]]) for column, extra in zip(columns, tail))
+        return columns
+
+    @staticmethod
+    def _ranked(lab: np.ndarray, gathered, limit: Optional[int], max_delta_e: Optional[float],
+                per_artwork: bool) -> List[Dict]:
+        """Exact CIEDE2000 ranking of gathered points, closest first"""
+        labs, ids, coverage, hexes = gathered
+        if not len(labs):
+            return []
+        delta_e = delta_e_cie2000_one_to_many(lab, labs)
+        order = np.argsort(delta_e, kind='stable')
+        if max_delta_e is not None:
+            order = order[:np.searchsorted(delta_e[order], max_delta_e, side='right')]
+        if per_artwork:
+            # np.unique keeps each artwork's first (closest) position
+            _, first = np.unique(ids[order], return_index=True)
+            order = order[np.sort(first)]
+        return [
+            {
+                'artwork_id': int(ids[i]),
+                'hex': str(hexes[i]),
+                'coverage': float(coverage[i]),
+                'delta_e': float(delta_e[i])
+            }
+            for i in order[:limit]
+        ]
+
+    def radius(self, hex_color: str, max_delta_e: float, limit: Optional[int] = None,
+               per_artwork: bool = True) -> List[Dict]:
+        """Palette colors within max_delta_e (CIEDE2000) of hex_color, closest first
+
+        With per_artwork only each artwork's closest color is kept.
+        """
+        lab = np.asarray(hex_to_lab(hex_color), dtype=np.float64)
+        gathered = self._gather(lab, max_delta_e * self.candidate_factor)
+        return self._ranked(lab, gathered, limit, max_delta_e, per_artwork)
+
+    def nearest(self, hex_color: str, k: int = 5, per_artwork: bool = True) -> List[Dict]:
+        """The k palette colors (or artworks) closest to hex_color by CIEDE2000
+
+        The search doubles from a small distance until k candidates are
+        found; the k-th of those bounds the answer, so at most one wider
+        search follows.
+        """
+        lab = np.asarray(hex_to_lab(hex_color), dtype=np.float64)
+        bound = 1.0
+        while True:
+            found = self._ranked(lab, self._gather(lab, bound), k, None, per_artwork)
+            if len(found) >= k or bound >= 100:  # Beyond any CIEDE2000 distance in sRGB
+                break
+            bound *= 2
+
+        if not found:
+            return []
+        needed = found[-1]['delta_e'] * self.candidate_factor
+        if needed <= bound:
+            return found  # Everything that could rank higher was already searched
+        return self._ranked(lab, self._gather(lab, needed), k, None, per_artwork)
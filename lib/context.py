@@ -0,0 +1,40 @@
+from typing import Dict, List, Tuple
+from _delta_e import hex_to_lab
+
+class ThemeContext:
+    """Artworks, palettes and LAB values for one theme, loaded once per command
+
+    Every stage of a command (clustering, scoring, visualization) reads from
+    the same context instead of going back to the database.
+    """
+    def __init__(self, theme: str, artworks: List[dict], palettes: Dict[int, list]):
+        self.theme = theme
+        self.artworks = artworks
+        self.palettes = palettes
+        self._labs: Dict[int, List[Tuple[float, float, float]]] = {}
+
+    @classmethod
+    async def load(cls, db, theme: str) -> 'ThemeContext':
+        """Load a theme with a single query, reusing the palette column it returns"""
+        artworks = await db.get_artworks_by_tag(theme)
+        palettes = {
+            artwork['id']: db.parse_palette_concat(artwork.get('palette'))
+            for artwork in artworks
+        }
+        return cls(theme, artworks, palettes)
+
+    def palette(self, artwork_id: int) -> list:
+        """Sorted palette rows for an artwork (empty if it has none)"""
+        return self.palettes.get(artwork_id, [])
+
+    def labs(self, artwork_id: int) -> List[Tuple[float, float, float]]:
+        """LAB tuples parallel to palette(artwork_id), computed at most once"""
+        if artwork_id not in self._labs:
+            self._labs[artwork_id] = [self._lab(color) for color in self.palette(artwork_id)]
+        return self._labs[artwork_id]
+
+    @staticmethod
+    def _lab(color: dict) -> Tuple[float, float, float]:
+        if color.get('lab_l') is not None:
+            return (float(color['lab_l']), float(color['lab_a']), float(color['lab_b']))
+        return hex_to_lab(color['hex_code'])
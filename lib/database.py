@@ -2,15 +2,43 @@ import aiomysql
 import os
 import logging
 from urllib.parse import urlparse
-from typing import Any, Optional, Dict, List, Union
+from typing import Any, Optional, Dict, List, Tuple, Union
 from mysql.connector import connect, Error  # Import MySQL connector
 import asyncio
 import os
 import aiomysql
 import logging
 import asyncio
+import json
+import math
+import random
+import time
 from urllib.parse import urlparse
 from typing import Optional, Dict, Union
+from _delta_e import hex_to_lab
+from lib.tags import TagIndex
+from lib.color_index import ColorIndex
+from lib.cache import TTLCache
+from lib.batcher import WriteBatcher
+from lib.extractors import histogram_matrix
+import numpy as np
+
+PALETTE_INSERT_QUERY = '''
+    INSERT INTO color_palettes (artwork_id, hex_code, dominance_rank, coverage, lab_l, lab_a, lab_b)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+'''
+
+HISTOGRAM_UPSERT_QUERY = '''
+    INSERT INTO color_histograms (artwork_id, histogram)
+    VALUES (%s, %s)
+    ON DUPLICATE KEY UPDATE histogram = VALUES(histogram)
+'''
+
+TAG_INSERT_QUERY = '''
+    INSERT INTO artwork_tags (artwork_id, tag)
+    VALUES (%s, %s)
+    ON DUPLICATE KEY UPDATE tag=tag
+'''
 
 class MySQLStorage:
     def __init__(self):
@@ -19,6 +47,19 @@ class MySQLStorage:
         self.connection_timeout = 30
         self.max_retries = 3
         self.retry_delay = 2
+        self.backfill_batch_size = 1000
+        self.tag_index = TagIndex()
+        self.color_index = ColorIndex()
+        self.artwork_id_refresh_interval = 300  # seconds
+        self._artwork_ids: List[int] = []
+        self._artwork_ids_loaded_at: Optional[float] = None  # None until first loaded
+        self.artist_name_unique = False  # Set by init_db; enables artist upserts in submit()
+        # Discord ID -> submitter row and lower(artist_name) -> artist row
+        self.submitter_cache = TTLCache(maxsize=2048, ttl=900)
+        self.artist_cache = TTLCache(maxsize=2048, ttl=900)
+        # Optional write-behind coalescing of tag inserts (WRITE_BATCH_WINDOW_MS > 0)
+        batch_window_ms = int(os.getenv('WRITE_BATCH_WINDOW_MS', '0'))
+        self.write_batcher = WriteBatcher(self, max_delay=batch_window_ms / 1000) if batch_window_ms > 0 else None
 
     def _parse_db_config(self) -> Dict[str, Union[str, int]]:
         """Parse and validate database configuration from environment"""
@@ -123,7 +164,7 @@ class MySQLStorage:
                             artist_name VARCHAR(255) NOT NULL,
                             social_media_link TEXT,
                             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                            INDEX idx_artist_name (artist_name)
+                            UNIQUE KEY unique_artist_name (artist_name)
                         ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4''',
                         
                         '''CREATE TABLE IF NOT EXISTS artworks (
@@ -137,7 +178,8 @@ class MySQLStorage:
                             FOREIGN KEY (submitter_id) REFERENCES submitters(id),
                             FOREIGN KEY (artist_id) REFERENCES artists(id),
                             INDEX idx_artist (artist_id),
-                            INDEX idx_submitter (submitter_id)
+                            INDEX idx_submitter (submitter_id),
+                            INDEX idx_artist_created (artist_id, created_at, id)
                         ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4''',
                     
                         '''CREATE TABLE IF NOT EXISTS color_palettes (
@@ -146,6 +188,9 @@ class MySQLStorage:
                             hex_code VARCHAR(7) NOT NULL,
                             dominance_rank TINYINT NOT NULL,
                             coverage DECIMAL(5,2),
+                            lab_l FLOAT,
+                            lab_a FLOAT,
+                            lab_b FLOAT,
                             FOREIGN KEY (artwork_id) REFERENCES artworks(id),
                             CONSTRAINT valid_hex CHECK (hex_code REGEXP '^#[0-9A-F]{6}$'),
                             INDEX idx_artwork (artwork_id),
@@ -159,6 +204,32 @@ class MySQLStorage:
                             FOREIGN KEY (artwork_id) REFERENCES artworks(id),
                             INDEX idx_tag (tag),
                             UNIQUE KEY unique_artwork_tag (artwork_id, tag)
+                        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4''',
+
+                        '''CREATE TABLE IF NOT EXISTS palette_cache (
+                            content_hash CHAR(64) PRIMARY KEY,
+                            palette TEXT NOT NULL,
+                            histogram BLOB,
+                            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4''',
+                        '''CREATE TABLE IF NOT EXISTS color_histograms (
+                            artwork_id INT PRIMARY KEY,
+                            histogram BLOB NOT NULL,
+                            FOREIGN KEY (artwork_id) REFERENCES artworks(id) ON DELETE CASCADE
+                        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4''',
+                        '''CREATE TABLE IF NOT EXISTS analysis_jobs (
+                            id INT AUTO_INCREMENT PRIMARY KEY,
+                            artwork_id INT NOT NULL,
+                            image_url TEXT NOT NULL,
+                            status ENUM('pending', 'running', 'done', 'dead') NOT NULL DEFAULT 'pending',
+                            attempts INT NOT NULL DEFAULT 0,
+                            next_attempt_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                            last_error TEXT,
+                            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                            UNIQUE KEY unique_job_artwork (artwork_id),
+                            INDEX idx_status_next (status, next_attempt_at),
+                            FOREIGN KEY (artwork_id) REFERENCES artworks(id) ON DELETE CASCADE
                         ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4'''
                     ]
                     
@@ -167,7 +238,6 @@ class MySQLStorage:
                     
                     await cursor.execute("SET sql_notes = 1;")
                     await conn.commit()
-                    return True
                     
                 except Exception as e:
                     await conn.rollback()
@@ -175,26 +245,192 @@ class MySQLStorage:
                     return False
                 finally:
                     await cursor.execute("SET sql_notes = 1;")
+
+        migrated = await self._migrate_palette_lab()
+        migrated = await self._ensure_column('palette_cache', 'histogram', 'BLOB') and migrated
+        migrated = await self._ensure_index(
+            'artworks', 'idx_artist_created', '(artist_id, created_at, id)'
+        ) and migrated
+        # Fails (and submit() falls back to select-then-insert) if duplicate names already exist
+        self.artist_name_unique = await self._ensure_index(
+            'artists', 'unique_artist_name', '(artist_name)', kind='UNIQUE INDEX'
+        )
+        await self.refresh_tag_index()
+        await self.refresh_color_index()
+        return migrated
+
+    async def _ensure_column(self, table: str, column: str, definition: str) -> bool:
+        """Add a column to an existing table if it is missing"""
+        async with self.pool.acquire() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cursor:
+                try:
+                    await cursor.execute("""
+                        SELECT 1 FROM information_schema.COLUMNS
+                        WHERE TABLE_SCHEMA = DATABASE()
+                          AND TABLE_NAME = %s AND COLUMN_NAME = %s
+                    """, (table, column))
+                    if not await cursor.fetchone():
+                        await cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+                        await conn.commit()
+                    return True
+                except Exception as e:
+                    await conn.rollback()
+                    self.logger.error(f"Adding column {table}.{column} failed: {e}")
+                    return False
+
+    async def _ensure_index(self, table: str, index_name: str, columns: str, kind: str = 'INDEX') -> bool:
+        """Add an index to an existing table if it is missing"""
+        async with self.pool.acquire() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cursor:
+                try:
+                    await cursor.execute("""
+                        SELECT 1 FROM information_schema.STATISTICS
+                        WHERE TABLE_SCHEMA = DATABASE()
+                          AND TABLE_NAME = %s AND INDEX_NAME = %s
+                        LIMIT 1
+                    """, (table, index_name))
+                    if not await cursor.fetchone():
+                        await cursor.execute(f"ALTER TABLE {table} ADD {kind} {index_name} {columns}")
+                        self.logger.info(f"Added index {index_name} on {table}")
+                    return True
+                except Exception as e:
+                    self.logger.error(f"Index migration for {index_name} failed: {e}")
+                    return False
+
+    async def refresh_tag_index(self) -> None:
+        """Rebuild the in-memory tag index from the distinct stored tags"""
+        async with self.pool.acquire() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cursor:
+                # Served from idx_tag alone, no table scan
+                await cursor.execute("SELECT DISTINCT tag FROM artwork_tags")
+                self.tag_index.rebuild(row['tag'] for row in await cursor.fetchall())
+        self.logger.info("Tag index loaded")
+
+    async def refresh_color_index(self) -> None:
+        """Rebuild the in-memory Lab color index from every stored palette color"""
+        async with self.pool.acquire() as conn:
+            # Plain tuples rather than the pool's dict rows; there can be hundreds of thousands
+            async with conn.cursor(aiomysql.Cursor) as cursor:
+                await cursor.execute(
+                    "SELECT artwork_id, hex_code, coverage, lab_l, lab_a, lab_b FROM color_palettes"
+                )
+                rows = await cursor.fetchall()
+        self.color_index.rebuild(
+            (artwork_id, hex_code, coverage,
+             (lab_l, lab_a, lab_b) if lab_l is not None else hex_to_lab(hex_code))
+            for artwork_id, hex_code, coverage, lab_l, lab_a, lab_b in rows
+        )
+        self.logger.info(f"Color index loaded ({len(self.color_index)} colors)")
+
+    async def _resolve_tags(self, query: str) -> List[str]:
+        """Resolve a user's tag query to the exact stored tags it matches"""
+        if not self.tag_index.loaded:
+            await self.refresh_tag_index()
+        return self.tag_index.resolve(query)
+
+    async def _migrate_palette_lab(self) -> bool:
+        """Add LAB columns to color_palettes and backfill existing rows in batches"""
+        async with self.pool.acquire() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cursor:
+                try:
+                    await cursor.execute("""
+                        SELECT COLUMN_NAME FROM information_schema.COLUMNS
+                        WHERE TABLE_SCHEMA = DATABASE()
+                          AND TABLE_NAME = 'color_palettes'
+                          AND COLUMN_NAME IN ('lab_l', 'lab_a', 'lab_b')
+                    """)
+                    existing = {row['COLUMN_NAME'] for row in await cursor.fetchall()}
+                    for column in ('lab_l', 'lab_a', 'lab_b'):
+                        if column not in existing:
+                            await cursor.execute(
+                                f"ALTER TABLE color_palettes ADD COLUMN {column} FLOAT"
+                            )
+
+                    # Page by primary key so each batch seeks past the last one instead of rescanning
+                    backfilled = 0
+                    last_id = 0
+                    while True:
+                        await cursor.execute("""
+                            SELECT id, hex_code FROM color_palettes
+                            WHERE id > %s AND lab_l IS NULL
+                            ORDER BY id
+                            LIMIT %s
+                        """, (last_id, self.backfill_batch_size))
+                        rows = await cursor.fetchall()
+                        if not rows:
+                            break
+                        last_id = rows[-1]['id']
+
+                        await cursor.executemany(
+                            "UPDATE color_palettes SET lab_l = %s, lab_a = %s, lab_b = %s WHERE id = %s",
+                            [(*hex_to_lab(row['hex_code']), row['id']) for row in rows]
+                        )
+                        await conn.commit()
+                        backfilled += len(rows)
+
+                    if backfilled:
+                        self.logger.info(f"Backfilled LAB values for {backfilled} palette colors")
+                    return True
+
+                except Exception as e:
+                    await conn.rollback()
+                    self.logger.error(f"Palette LAB migration failed: {e}")
+                    return False
+    async def _refresh_artwork_ids(self) -> None:
+        """Reload the in-memory artwork ID array used for random sampling"""
+        async with self.pool.acquire() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cursor:
+                await cursor.execute("SELECT id FROM artworks")
+                self._artwork_ids = [row['id'] for row in await cursor.fetchall()]
+        self._artwork_ids_loaded_at = time.monotonic()
+
     async def get_random_artworks(self, limit: int = 5):
-        """Get completely random artworks"""
+        """Get completely random artworks
+
+        IDs are drawn uniformly from an in-memory array (refreshed every
+        artwork_id_refresh_interval seconds and appended to on submit), so
+        the query only touches the sampled rows. Untagged artworks are
+        included.
+        """
+        if (self._artwork_ids_loaded_at is None
+                or time.monotonic() - self._artwork_ids_loaded_at > self.artwork_id_refresh_interval):
+            await self._refresh_artwork_ids()
+
+        sample = random.sample(self._artwork_ids, min(limit, len(self._artwork_ids)))
+        return await self.get_artworks_by_ids(sample)
+
+    async def get_artworks_by_ids(self, artwork_ids: List[int]) -> List[dict]:
+        """Artworks with artist info and tags, in the order of artwork_ids"""
+        if not artwork_ids:
+            return []
+
+        placeholders = ', '.join(['%s'] * len(artwork_ids))
         async with self.pool.acquire() as conn:
             async with conn.cursor(aiomysql.DictCursor) as cursor:
-                await cursor.execute("""
+                await cursor.execute(f"""
                     SELECT a.*, ar.artist_name, ar.social_media_link, 
                         GROUP_CONCAT(at.tag) as tags
                     FROM artworks a
                     JOIN artists ar ON a.artist_id = ar.id
-                    JOIN artwork_tags at ON a.id = at.artwork_id
+                    LEFT JOIN artwork_tags at ON a.id = at.artwork_id
+                    WHERE a.id IN ({placeholders})
                     GROUP BY a.id
-                    ORDER BY RAND()
-                    LIMIT %s
-                """, (limit,))
-                return await cursor.fetchall()
+                """, list(artwork_ids))
+                rows = await cursor.fetchall()
+
+        # Keep the caller's order (e.g. the random draw) rather than primary-key order
+        order = {artwork_id: i for i, artwork_id in enumerate(artwork_ids)}
+        return sorted(rows, key=lambda row: order[row['id']])
     async def get_artworks_with_artist_info(self, tag: str):
         """Get artworks with joined artist information"""
+        tags = await self._resolve_tags(tag)
+        if not tags:
+            return []
+
+        placeholders = ', '.join(['%s'] * len(tags))
         async with self.pool.acquire() as conn:
             async with conn.cursor(aiomysql.DictCursor) as cursor:
-                await cursor.execute("""
+                await cursor.execute(f"""
                     SELECT 
                         a.*,
                         ar.artist_name,
@@ -203,10 +439,10 @@ class MySQLStorage:
                     FROM artworks a
                     JOIN artists ar ON a.artist_id = ar.id
                     JOIN artwork_tags at ON a.id = at.artwork_id
-                    WHERE at.tag LIKE %s
+                    WHERE at.tag IN ({placeholders})
                     GROUP BY a.id
                     LIMIT 25
-                """, (f"%{tag}%",))
+                """, tags)
                 return await cursor.fetchall()
 
     async def validate_connection(self) -> bool:
@@ -224,137 +460,358 @@ class MySQLStorage:
             self.logger.error(f"Connection validation failed: {e}")
             return False
 
-    async def get_or_create_submitter(self, submitter_id: str, name: str):
+    def identity_cache_stats(self) -> Dict[str, Dict[str, float]]:
+        """Hit rates of the submitter and artist identity caches"""
+        return {
+            'submitters': self.submitter_cache.stats(),
+            'artists': self.artist_cache.stats()
+        }
+
+    async def get_artworks_by_artist(self, artist_id: int, limit: int, offset: int) -> List[dict]:
+        """Get paginated artworks without tags"""
         async with self.pool.acquire() as conn:
-            async with conn.cursor() as cursor:
-                # Try to get existing submitter
+            async with conn.cursor(aiomysql.DictCursor) as cursor:
+                await cursor.execute("""
+                    SELECT * FROM artworks
+                    WHERE artist_id = %s
+                    ORDER BY created_at DESC
+                    LIMIT %s OFFSET %s
+                """, (artist_id, limit, offset))
+                return await cursor.fetchall()
+    async def get_artist_by_name(self, artist_name: str) -> Optional[dict]:
+        """Read-only artist lookup (never creates a row)"""
+        async with self.pool.acquire() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cursor:
                 await cursor.execute(
-                    "SELECT * FROM submitters WHERE submitter_id = %s",
-                    (submitter_id,)
+                    "SELECT * FROM artists WHERE artist_name = %s LIMIT 1",
+                    (artist_name,)
                 )
-                submitter = await cursor.fetchone()
-                
-                if not submitter:
-                    # Create new submitter
+                return await cursor.fetchone()
+
+    async def get_artist_artworks_with_tags(self, artist_id: int, limit: int, offset: int = 0,
+                                            after: Optional[tuple] = None,
+                                            before: Optional[tuple] = None) -> List[dict]:
+        """Get a page of an artist's artworks with their tags aggregated in one query
+
+        Pages are ordered newest first by (created_at, id). Pass the
+        (created_at, id) key of the last row shown as after= for the next
+        page, or of the first row shown as before= for the previous one;
+        both are keyset seeks on idx_artist_created and cost the same at any
+        depth. offset is only used when neither key is given.
+        """
+        if after is not None:
+            seek = "AND (created_at < %s OR (created_at = %s AND id < %s))"
+            params = (artist_id, after[0], after[0], after[1], limit)
+            order, paging = "DESC", "LIMIT %s"
+        elif before is not None:
+            seek = "AND (created_at > %s OR (created_at = %s AND id > %s))"
+            params = (artist_id, before[0], before[0], before[1], limit)
+            order, paging = "ASC", "LIMIT %s"
+        else:
+            seek = ""
+            params = (artist_id, limit, offset)
+            order, paging = "DESC", "LIMIT %s OFFSET %s"
+
+        async with self.pool.acquire() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cursor:
+                await cursor.execute(f"""
+                    SELECT a.*, GROUP_CONCAT(at.tag ORDER BY at.id) as tags
+                    FROM (
+                        SELECT * FROM artworks
+                        WHERE artist_id = %s {seek}
+                        ORDER BY created_at {order}, id {order}
+                        {paging}
+                    ) a
+                    LEFT JOIN artwork_tags at ON a.id = at.artwork_id
+                    GROUP BY a.id
+                    ORDER BY a.created_at DESC, a.id DESC
+                """, params)
+                return await cursor.fetchall()
+
+    @staticmethod
+    def _tag_rows(artwork_id: int, tags: List[str]) -> list:
+        """Rows for TAG_INSERT_QUERY; executemany sends them as one multi-row INSERT"""
+        return [(artwork_id, tag.lower()) for tag in tags or []]
+
+    @staticmethod
+    def _palette_rows(artwork_id: int, colors: List[Dict[str, Union[str, float]]]) -> list:
+        """Rows for PALETTE_INSERT_QUERY (LAB is computed once here, never on read)"""
+        return [
+            (artwork_id, color['hex'], idx + 1, color.get('percentage'), *hex_to_lab(color['hex']))
+            for idx, color in enumerate(colors)
+        ]
+
+    async def submit(self, submitter_id: str, submitter_name: str, artist_name: str,
+                     social_media_link: Optional[str], image_url: str, title: Optional[str],
+                     description: Optional[str], tags: List[str],
+                     enqueue_analysis: bool = False) -> int:
+        """Store a whole submission on one connection in one transaction
+
+        Submitter and artist are upserted (ON DUPLICATE KEY UPDATE
+        id=LAST_INSERT_ID(id) hands back the existing row's id), then the
+        artwork and its tags are inserted; executemany sends the tags as a
+        single multi-row INSERT. Nothing is committed
+        unless every step succeeds, so a failure leaves no orphan artwork.
+        Known submitters and artists are taken from the identity caches
+        and skip their upsert unless the name or social link changed.
+
+        With a write_batcher, tags are instead committed by the batcher
+        shortly after the artwork row, merged with other submissions; if
+        that flush fails the artwork is deleted again before re-raising.
+        With enqueue_analysis, a pending analysis job is written in the same
+        transaction for AnalysisQueue, which stores the palette.
+        Returns the new artwork id.
+        """
+        tags = [tag.lower() for tag in tags or []]
+        artist_key = (artist_name or '').lower()
+        submitter = self.submitter_cache.get(submitter_id)
+        if submitter and submitter.get('name') != submitter_name:
+            submitter = None
+        artist = self.artist_cache.get(artist_key)
+        # A cached link of None means "not known"; any supplied link that differs goes through the upsert
+        if artist and social_media_link and artist.get('social_media_link') != social_media_link:
+            artist = None
+
+        async with self.pool.acquire() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cursor:
+                try:
+                    await conn.begin()
+                    if submitter:
+                        submitter_pk = submitter['id']
+                    else:
+                        await cursor.execute(
+                            """INSERT INTO submitters (submitter_id, name)
+                            VALUES (%s, %s)
+                            ON DUPLICATE KEY UPDATE id = LAST_INSERT_ID(id), name = VALUES(name)""",
+                            (submitter_id, submitter_name)
+                        )
+                        submitter_pk = cursor.lastrowid
+
+                    if artist:
+                        artist_pk = artist['id']
+                    else:
+                        artist_pk = await self._upsert_artist(cursor, artist_name, social_media_link)
+
                     await cursor.execute(
-                        """INSERT INTO submitters 
-                        (submitter_id, name) 
-                        VALUES (%s, %s)""",
-                        (submitter_id, name)
+                        """INSERT INTO artworks
+                        (submitter_id, artist_id, image_url, title, description)
+                        VALUES (%s, %s, %s, %s, %s)""",
+                        (submitter_pk, artist_pk, image_url, title, description)
                     )
+                    artwork_id = cursor.lastrowid
+
+                    if enqueue_analysis:
+                        await cursor.execute(
+                            "INSERT INTO analysis_jobs (artwork_id, image_url) VALUES (%s, %s)",
+                            (artwork_id, image_url)
+                        )
+
+                    if self.write_batcher is None and tags:
+                        await cursor.executemany(TAG_INSERT_QUERY, self._tag_rows(artwork_id, tags))
+
                     await conn.commit()
-                    return {'id': cursor.lastrowid, 'submitter_id': submitter_id, 'name': name}
-                
-                return submitter
+                except Exception:
+                    await conn.rollback()
+                    raise
+
+        if self.write_batcher is not None:
+            try:
+                await self.write_batcher.add(TAG_INSERT_QUERY, self._tag_rows(artwork_id, tags))
+            except Exception:
+                await self._delete_artwork(artwork_id)
+                raise
+
+        # Cache identities only once they are committed
+        if not submitter:
+            self.submitter_cache.set(submitter_id, {
+                'id': submitter_pk, 'submitter_id': submitter_id, 'name': submitter_name
+            })
+        if not artist:
+            # Without a link in hand the stored one is unknown; cache it as None
+            self.artist_cache.set(artist_key, {
+                'id': artist_pk, 'artist_name': artist_name, 'social_media_link': social_media_link
+            })
+        self.tag_index.add(tags)
+        self._artwork_ids.append(artwork_id)
+        return artwork_id
 
-    async def get_or_create_artist(self, artist_name: str, social_media_link:str):
+    async def _delete_artwork(self, artwork_id: int) -> None:
+        """Remove an artwork and its children (compensates a failed batched write)"""
         async with self.pool.acquire() as conn:
             async with conn.cursor() as cursor:
-                # Get existing artist
-                await cursor.execute(
-                    "SELECT * FROM artists WHERE artist_name = %s",
-                (artist_name,)
+                for query in (
+                    "DELETE FROM artwork_tags WHERE artwork_id = %s",
+                    "DELETE FROM color_palettes WHERE artwork_id = %s",
+                    "DELETE FROM artworks WHERE id = %s"
+                ):
+                    await cursor.execute(query, (artwork_id,))
+                await conn.commit()
+
+    async def _upsert_artist(self, cursor, artist_name: str, social_media_link: Optional[str]) -> int:
+        """Insert or update an artist inside the caller's transaction, returning its id"""
+        if self.artist_name_unique:
+            # Only overwrite the stored link when a new one was supplied
+            await cursor.execute(
+                """INSERT INTO artists (artist_name, social_media_link)
+                VALUES (%s, %s)
+                ON DUPLICATE KEY UPDATE
+                    id = LAST_INSERT_ID(id),
+                    social_media_link = COALESCE(NULLIF(VALUES(social_media_link), ''), social_media_link)""",
+                (artist_name, social_media_link)
             )
-                artist = await cursor.fetchone()
-            
-                if not artist:
-                # Create new artist with whatever fields were provided
-                    await cursor.execute(
-                    """INSERT INTO artists (artist_name, social_media_link)
-                    VALUES (%s, %s)""",
-                    (artist_name, social_media_link)
+            return cursor.lastrowid
+
+        await cursor.execute(
+            "SELECT id, social_media_link FROM artists WHERE artist_name = %s LIMIT 1 FOR UPDATE",
+            (artist_name,)
+        )
+        artist = await cursor.fetchone()
+        if not artist:
+            await cursor.execute(
+                "INSERT INTO artists (artist_name, social_media_link) VALUES (%s, %s)",
+                (artist_name, social_media_link)
+            )
+            return cursor.lastrowid
+        if social_media_link and artist['social_media_link'] != social_media_link:
+            await cursor.execute(
+                "UPDATE artists SET social_media_link = %s WHERE id = %s",
+                (social_media_link, artist['id'])
+            )
+        return artist['id']
+    async def get_cached_analysis(self, content_hash: str) -> Optional[Dict]:
+        """Look up a previously extracted palette and histogram by image content hash
+
+        Returns {'palette': [...], 'histogram': bytes or None}; entries
+        cached before histograms existed have none.
+        """
+        async with self.pool.acquire() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cursor:
+                await cursor.execute(
+                    "SELECT palette, histogram FROM palette_cache WHERE content_hash = %s",
+                    (content_hash,)
                 )
-                    await conn.commit()
-                    return {
-                    'id': cursor.lastrowid,
-                    'name': artist_name,
-                    'social_media_link': social_media_link
-                }
-            
-            # Update social media if provided and different
-                if social_media_link and artist.get('social_media_link') != social_media_link:
-                    await cursor.execute(
-                    "UPDATE artists SET social_media_link = %s WHERE id = %s",
-                    (social_media_link, artist['id'])
+                result = await cursor.fetchone()
+                if not result:
+                    return None
+                return {'palette': json.loads(result['palette']), 'histogram': result['histogram']}
+
+    async def cache_palette(self, content_hash: str, colors: List[Dict[str, Union[str, float]]],
+                            histogram: Optional[bytes] = None) -> None:
+        """Remember the palette (and histogram) extracted for an image's content hash"""
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(
+                    """INSERT INTO palette_cache (content_hash, palette, histogram)
+                    VALUES (%s, %s, %s)
+                    ON DUPLICATE KEY UPDATE palette = VALUES(palette), histogram = VALUES(histogram)""",
+                    (content_hash, json.dumps(colors), histogram)
                 )
-                    await conn.commit()
-                    artist['social_media_link'] = social_media_link
-            
-                return artist
-    async def get_artworks_by_artist(self, artist_id: int, limit: int, offset: int) -> List[dict]:
-        """Get paginated artworks without tags"""
+                await conn.commit()
+
+    async def get_theme_histograms(self, theme: str) -> Tuple[List[int], np.ndarray]:
+        """Histograms of every artwork tagged with theme as (ids, (N, HISTOGRAM_SIZE) uint16 matrix)
+
+        Row i of the matrix belongs to ids[i]; artworks without a stored
+        histogram are left out.
+        """
+        tags = await self._resolve_tags(theme)
+        if not tags:
+            return [], histogram_matrix([])
+
+        placeholders = ', '.join(['%s'] * len(tags))
         async with self.pool.acquire() as conn:
             async with conn.cursor(aiomysql.DictCursor) as cursor:
-                await cursor.execute("""
-                    SELECT * FROM artworks
-                    WHERE artist_id = %s
-                    ORDER BY created_at DESC
-                    LIMIT %s OFFSET %s
-                """, (artist_id, limit, offset))
-                return await cursor.fetchall()
-    async def create_artwork(self, submitter_id: int, artist_id: int, image_url: str, title: str, description: str, tags: List[str]):
+                await cursor.execute(f'''
+                    SELECT ch.artwork_id, ch.histogram
+                    FROM color_histograms ch
+                    WHERE ch.artwork_id IN (
+                        SELECT artwork_id FROM artwork_tags WHERE tag IN ({placeholders})
+                    )
+                    ORDER BY ch.artwork_id
+                ''', tags)
+                rows = await cursor.fetchall()
+        return [row['artwork_id'] for row in rows], histogram_matrix([row['histogram'] for row in rows])
+
+    async def claim_analysis_job(self) -> Optional[dict]:
+        """Mark the oldest due pending job as running and return it, or None
+
+        The single UPDATE ... LIMIT 1 claims atomically, so concurrent
+        workers never receive the same job; id = LAST_INSERT_ID(id) hands
+        the claimed row's id back through lastrowid.
+        """
         async with self.pool.acquire() as conn:
-            async with conn.cursor() as cursor:
+            async with conn.cursor(aiomysql.DictCursor) as cursor:
                 await cursor.execute(
-                    """INSERT INTO artworks 
-                    (submitter_id, artist_id, image_url, title, description) 
-                    VALUES (%s, %s, %s, %s, %s)""",
-                    (submitter_id, artist_id, image_url, title, description)
+                    """UPDATE analysis_jobs
+                    SET id = LAST_INSERT_ID(id), status = 'running', attempts = attempts + 1
+                    WHERE status = 'pending' AND next_attempt_at <= NOW()
+                    ORDER BY next_attempt_at, id
+                    LIMIT 1"""
                 )
-                artwork_id = cursor.lastrowid
-                
-                # Store tags
-                for tag in tags:
+                if not cursor.rowcount:
+                    await conn.commit()
+                    return None
+                job_id = cursor.lastrowid
+                await cursor.execute(
+                    "SELECT id, artwork_id, image_url, attempts FROM analysis_jobs WHERE id = %s",
+                    (job_id,)
+                )
+                job = await cursor.fetchone()
+                await conn.commit()
+                return job
+
+    async def complete_analysis_job(self, job_id: int, artwork_id: int,
+                                    colors: List[Dict[str, Union[str, float]]],
+                                    histogram: Optional[bytes] = None) -> None:
+        """Replace the artwork's palette (and histogram) and mark the job done in one transaction"""
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                try:
+                    await conn.begin()
+                    # A retried job may follow a partial earlier attempt
+                    await cursor.execute("DELETE FROM color_palettes WHERE artwork_id = %s", (artwork_id,))
+                    await cursor.executemany(PALETTE_INSERT_QUERY, self._palette_rows(artwork_id, colors))
+                    if histogram:
+                        await cursor.execute(HISTOGRAM_UPSERT_QUERY, (artwork_id, histogram))
                     await cursor.execute(
-                        """INSERT INTO artwork_tags 
-                        (artwork_id, tag) 
-                        VALUES (%s, %s)
-                        ON DUPLICATE KEY UPDATE tag=tag""",
-                        (artwork_id, tag.lower())
+                        "UPDATE analysis_jobs SET status = 'done', last_error = NULL WHERE id = %s",
+                        (job_id,)
                     )
-                
-                await conn.commit()
-                return artwork_id    
+                    await conn.commit()
+                except Exception:
+                    await conn.rollback()
+                    raise
+        self.color_index.replace(artwork_id, colors)
 
-    async def store_artist(self, artist_name: str, social_media_link: str) -> int:
-        """Store a new artist and return their ID"""
-        query = '''
-            INSERT INTO artists (artist_name, social_media_link)
-            VALUES (%s, %s)
-            ON DUPLICATE KEY UPDATE name=VALUES(name)
-        '''
-        cursor = await self.execute_query(query, (artist_name, social_media_link))
-        return cursor.lastrowid
-#
-    async def store_artwork(self, artist_id: int, image_url: str, 
-                            title: Optional[str] = None, 
-                            description: Optional[str] = None) -> int:
-        """Store artwork and return its ID"""
-        query = '''
-            INSERT INTO artworks (artist_id, image_url, title, description)
-            VALUES (%s, %s, %s, %s)
-        '''
-        cursor = await self.execute_query(query, (artist_id, image_url, title, description))
-        return cursor.lastrowid
+    async def fail_analysis_job(self, job_id: int, error: str, retry_in: Optional[float]) -> None:
+        """Reschedule a failed job retry_in seconds from now, or dead-letter it when None"""
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                if retry_in is None:
+                    await cursor.execute(
+                        "UPDATE analysis_jobs SET status = 'dead', last_error = %s WHERE id = %s",
+                        (error[:1000], job_id)
+                    )
+                else:
+                    await cursor.execute(
+                        """UPDATE analysis_jobs
+                        SET status = 'pending', last_error = %s,
+                            next_attempt_at = NOW() + INTERVAL %s SECOND
+                        WHERE id = %s""",
+                        (error[:1000], math.ceil(retry_in), job_id)
+                    )
+                await conn.commit()
 
-    async def store_palette(self, artwork_id: int, colors: List[Dict[str, Union[str, float]]]) -> None:
-        """Store color palette for an artwork"""
-        
-        
-        query = '''
-            INSERT INTO color_palettes (artwork_id, hex_code, dominance_rank, coverage)
-            VALUES (%s, %s, %s, %s)
-        '''
-        # Prepare batch insert
-        palette_data = [
-            (artwork_id, color['hex'], idx + 1, color.get('percentage'))
-            for idx, color in enumerate(colors)
-        ]
-        
+    async def requeue_running_analysis_jobs(self) -> int:
+        """Return jobs left 'running' by a previous process to the queue"""
         async with self.pool.acquire() as conn:
             async with conn.cursor() as cursor:
-                await cursor.executemany(query, palette_data)
+                await cursor.execute(
+                    "UPDATE analysis_jobs SET status = 'pending', next_attempt_at = NOW() WHERE status = 'running'"
+                )
                 await conn.commit()
+                return cursor.rowcount
+
     async def get_cdn_url(self, artwork_id: int) -> Optional[str]:
         """Fetch the CDN URL for a specific artwork."""
         query = """
@@ -369,19 +826,27 @@ class MySQLStorage:
                 return result['image_url'] if result else None
     async def get_artworks_by_tag(self, tag: str):
         """Get artworks with specific tag including their palettes"""
+        tags = await self._resolve_tags(tag)
+        if not tags:
+            return []
+
+        placeholders = ', '.join(['%s'] * len(tags))
         async with self.pool.acquire() as conn:
             async with conn.cursor(aiomysql.DictCursor) as cursor:
-                await cursor.execute("""
+                await cursor.execute(f"""
                     SELECT a.*, 
                         GROUP_CONCAT(at.tag) as tags,
-                        (SELECT GROUP_CONCAT(CONCAT_WS('|', cp.hex_code, cp.dominance_rank))
+                        (SELECT GROUP_CONCAT(
+                            CONCAT_WS('|', cp.hex_code, cp.dominance_rank, IFNULL(cp.coverage, ''),
+                                IFNULL(cp.lab_l, ''), IFNULL(cp.lab_a, ''), IFNULL(cp.lab_b, ''))
+                            ORDER BY cp.dominance_rank)
                         FROM color_palettes cp 
                         WHERE cp.artwork_id = a.id) as palette
                     FROM artworks a
                     JOIN artwork_tags at ON a.id = at.artwork_id
-                    WHERE at.tag LIKE %s
+                    WHERE at.tag IN ({placeholders})
                     GROUP BY a.id
-                """, (f"%{tag}%",))
+                """, tags)
                 return await cursor.fetchall()
     async def get_artwork_tags(self, artwork_id: int) -> List[str]:
         """Get all tags for a specific artwork"""
@@ -414,21 +879,27 @@ class MySQLStorage:
         return sorted(palette, key=sort_key)
     async def get_theme_palettes(self, theme: str) -> list:
         """Get all palettes for artworks with matching tags"""
+        tags = await self._resolve_tags(theme)
+        if not tags:
+            return []
+
+        placeholders = ', '.join(['%s'] * len(tags))
         async with self.pool.acquire() as conn:
             async with conn.cursor() as cursor:
-                await cursor.execute("""
+                await cursor.execute(f"""
                     SELECT cp.* 
                     FROM color_palettes cp
-                    JOIN artwork_tags at ON cp.artwork_id = at.artwork_id
-                    WHERE at.tag LIKE %s
+                    WHERE cp.artwork_id IN (
+                        SELECT artwork_id FROM artwork_tags WHERE tag IN ({placeholders})
+                    )
                     ORDER BY cp.dominance_rank
-                """, (f"%{theme}%",))
+                """, tags)
                 return await cursor.fetchall()
     
     async def get_artwork_palette(self, artwork_id: int):
         """Get palette with guaranteed sorting"""
         query = '''
-            SELECT hex_code, dominance_rank, coverage
+            SELECT hex_code, dominance_rank, coverage, lab_l, lab_a, lab_b
             FROM color_palettes
             WHERE artwork_id = %s
         '''
@@ -439,41 +910,56 @@ class MySQLStorage:
                 raw_palette = await cursor.fetchall()
             
                 # Validate all fields exist
-                validated = []
-                for color in raw_palette:
-                    validated.append({
-                        'hex_code': color.get('hex_code', '#000000'),
-                        'dominance_rank': color.get('dominance_rank'),
-                        'coverage': color.get('coverage')
-                    })
+                validated = [self._validate_palette_row(color) for color in raw_palette]
             
                 return self.safe_sort_palette(validated)
+
+    def parse_palette_concat(self, palette: Optional[str]) -> list:
+        """Parse the GROUP_CONCAT palette column from get_artworks_by_tag into sorted rows"""
+        if not palette:
+            return []
+
+        def number(value):
+            return float(value) if value != '' else None
+
+        rows = []
+        for entry in palette.split(','):
+            parts = entry.split('|')
+            if len(parts) != 6:
+                continue
+            hex_code, rank, coverage, lab_l, lab_a, lab_b = parts
+            rows.append(self._validate_palette_row({
+                'hex_code': hex_code,
+                'dominance_rank': int(rank),
+                'coverage': number(coverage),
+                'lab_l': number(lab_l),
+                'lab_a': number(lab_a),
+                'lab_b': number(lab_b)
+            }))
+        return self.safe_sort_palette(rows)
+
+    @staticmethod
+    def _validate_palette_row(color: dict) -> dict:
+        """Normalise a color_palettes row so every expected key is present"""
+        return {
+            'hex_code': color.get('hex_code', '#000000'),
+            'dominance_rank': color.get('dominance_rank'),
+            'coverage': color.get('coverage'),
+            'lab_l': color.get('lab_l'),
+            'lab_a': color.get('lab_a'),
+            'lab_b': color.get('lab_b')
+        }
     async def close(self) -> None:
         """Cleanup resources when stopping"""
+        if self.write_batcher is not None and self.pool:
+            await self.write_batcher.close()
+        for name, stats in self.identity_cache_stats().items():
+            self.logger.info(
+                f"Identity cache ({name}): {stats['hits']} hits, {stats['misses']} misses "
+                f"({stats['hit_rate']:.0%} hit rate)"
+            )
         if self.pool:
             self.pool.close()
             await self.pool.wait_closed()
             self.pool = None
             self.logger.info("Database connections closed")
-
-    async def full_submission_pipeline(self, artist_id: int, image_url: str, palette: List[dict], metadata: dict) -> bool:
-        """Complete artwork storage workflow"""
-        try:
-            async with self.pool.acquire() as conn:
-                async with conn.cursor() as cursor:
-                    # Store artwork
-                    artwork_id = await self.store_artwork(
-                    artist_id=artist_id,
-                    image_url=image_url,
-                    title=metadata.get('title'),
-                    description=metadata.get('description')
-                )
-                
-                # Store palette
-                    await self.store_palette(artwork_id, palette)
-                
-                    return True
-        except Exception as e:
-            self.logger.error(f"Submission pipeline failed: {e}")
-            return False
-    
\ No newline at end of file
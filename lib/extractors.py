@@ -0,0 +1,145 @@
+import os
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from _delta_e import rgb_to_lab_batch
+
+MIN_ALPHA = 125  # Pixels more transparent than this are not part of the artwork
+KMEANS_SAMPLE = 20000  # Pixels used to fit centroids; coverage still counts every pixel
+KMEANS_ITERATIONS = 12
+HISTOGRAM_BINS = 8  # Per Lab axis; HISTOGRAM_BINS ** 3 bins in all
+HISTOGRAM_SIZE = HISTOGRAM_BINS ** 3
+HISTOGRAM_DTYPE = np.dtype('<u2')  # Stored as HISTOGRAM_SIZE little-endian uint16s
+HISTOGRAM_TOTAL = np.iinfo(HISTOGRAM_DTYPE).max  # Every histogram sums to about this
+
+
+def image_pixels(image: Image.Image) -> np.ndarray:
+    """Opaque pixels of a decoded image as an (N, 3) float32 array"""
+    rgba = np.asarray(image.convert('RGBA')).reshape(-1, 4)
+    opaque = rgba[rgba[:, 3] >= MIN_ALPHA, :3]
+    return (opaque if len(opaque) else rgba[:, :3]).astype(np.float32)
+
+
+def _nearest(pixels: np.ndarray, centers: np.ndarray) -> np.ndarray:
+    """Index of the nearest center (squared RGB distance) for every pixel"""
+    distances = (
+        (pixels * pixels).sum(axis=1)[:, None]
+        - 2.0 * pixels @ centers.T
+        + (centers * centers).sum(axis=1)[None, :]
+    )
+    return distances.argmin(axis=1)
+
+
+def coverage(pixels: np.ndarray, centers: np.ndarray) -> np.ndarray:
+    """Share of pixels (0-1) whose nearest palette color is each center"""
+    counts = np.bincount(_nearest(pixels, centers), minlength=len(centers))
+    return counts / max(len(pixels), 1)
+
+
+def _kmeans_plus_plus(pixels: np.ndarray, k: int, rng: np.random.Generator) -> np.ndarray:
+    centers = [pixels[rng.integers(len(pixels))]]
+    closest = ((pixels - centers[0]) ** 2).sum(axis=1)
+    for _ in range(1, k):
+        total = closest.sum()
+        if total <= 0:
+            break  # Fewer distinct colors than k
+        center = pixels[rng.choice(len(pixels), p=closest / total)]
+        centers.append(center)
+        closest = np.minimum(closest, ((pixels - center) ** 2).sum(axis=1))
+    return np.array(centers, dtype=np.float32)
+
+
+def kmeans_palette(image: Image.Image, color_count: int = 5, seed: int = 0) -> List[Tuple[Tuple[int, int, int], float]]:
+    """Vectorized k-means over the image's pixels
+
+    Centroids are fitted on an evenly strided sample of at most
+    KMEANS_SAMPLE pixels, then every opaque pixel is assigned once to
+    count real coverage. Seeded, so the same image always gives the same
+    palette. Returns (rgb, coverage) pairs, most dominant first.
+    """
+    pixels = image_pixels(image)
+    sample = pixels[::max(1, len(pixels) // KMEANS_SAMPLE)]
+    rng = np.random.default_rng(seed)
+    centers = _kmeans_plus_plus(sample, color_count, rng)
+
+    for _ in range(KMEANS_ITERATIONS):
+        labels = _nearest(sample, centers)
+        counts = np.bincount(labels, minlength=len(centers))
+        sums = np.stack([
+            np.bincount(labels, weights=sample[:, channel], minlength=len(centers))
+            for channel in range(3)
+        ], axis=1)
+        updated = np.where(counts[:, None] > 0, sums / np.maximum(counts, 1)[:, None], centers)
+        if np.abs(updated - centers).max() < 0.5:
+            centers = updated.astype(np.float32)
+            break
+        centers = updated.astype(np.float32)
+
+    return _ranked(pixels, centers)
+
+
+def colorthief_palette(image: Image.Image, color_count: int = 5, quality: int = 10) -> List[Tuple[Tuple[int, int, int], float]]:
+    """ColorThief's median cut, with coverage counted over the image's pixels"""
+    from colorthief import ColorThief
+
+    class _DecodedColorThief(ColorThief):
+        """ColorThief over an already decoded (and downscaled) PIL image"""
+        def __init__(self, decoded: Image.Image):
+            self.image = decoded
+
+    palette = _DecodedColorThief(image).get_palette(color_count=color_count, quality=quality)
+    return _ranked(image_pixels(image), np.array(palette, dtype=np.float32))
+
+
+def _ranked(pixels: np.ndarray, centers: np.ndarray) -> List[Tuple[Tuple[int, int, int], float]]:
+    """Pair centers with their coverage, dropping empty ones, largest first"""
+    shares = coverage(pixels, centers)
+    ranked = sorted(zip(centers, shares), key=lambda pair: pair[1], reverse=True)
+    return [
+        (tuple(int(round(c)) for c in np.clip(center, 0, 255)), float(share))
+        for center, share in ranked if share > 0
+    ]
+
+
+def lab_histogram(pixels: np.ndarray) -> np.ndarray:
+    """Quantized Lab histogram of (N, 3) RGB pixels, normalised to HISTOGRAM_TOTAL
+
+    L (0-100) and a/b (-128-128) are each cut into HISTOGRAM_BINS equal
+    bins; bin index is (l * HISTOGRAM_BINS + a) * HISTOGRAM_BINS + b.
+    Normalising makes images of any size directly comparable.
+    """
+    lab = rgb_to_lab_batch(pixels)
+    l_bin = np.clip(lab[:, 0] / (100 / HISTOGRAM_BINS), 0, HISTOGRAM_BINS - 1).astype(np.intp)
+    ab_bins = np.clip((lab[:, 1:] + 128) / (256 / HISTOGRAM_BINS), 0, HISTOGRAM_BINS - 1).astype(np.intp)
+    index = (l_bin * HISTOGRAM_BINS + ab_bins[:, 0]) * HISTOGRAM_BINS + ab_bins[:, 1]
+    counts = np.bincount(index, minlength=HISTOGRAM_SIZE)
+    return np.round(counts * (HISTOGRAM_TOTAL / max(counts.sum(), 1))).astype(HISTOGRAM_DTYPE)
+
+
+def histogram_matrix(blobs: List[bytes]) -> np.ndarray:
+    """Stack stored histogram BLOBs into one contiguous (N, HISTOGRAM_SIZE) uint16 matrix"""
+    if not blobs:
+        return np.zeros((0, HISTOGRAM_SIZE), dtype=HISTOGRAM_DTYPE)
+    return np.frombuffer(b''.join(blobs), dtype=HISTOGRAM_DTYPE).reshape(-1, HISTOGRAM_SIZE)
+
+
+def histogram_intersection(histogram: np.ndarray, matrix: np.ndarray) -> np.ndarray:
+    """Similarity (0-1) of one histogram to every row of a histogram matrix"""
+    return np.minimum(matrix, histogram).sum(axis=1, dtype=np.int64) / HISTOGRAM_TOTAL
+
+
+EXTRACTORS: Dict[str, Callable[..., List[Tuple[Tuple[int, int, int], float]]]] = {
+    'kmeans': kmeans_palette,
+    'colorthief': colorthief_palette,
+}
+
+
+def get_extractor(name: Optional[str] = None) -> Callable[..., List[Tuple[Tuple[int, int, int], float]]]:
+    """Extractor named by name or the PALETTE_ENGINE env var (default kmeans)"""
+    name = name or os.getenv('PALETTE_ENGINE', 'kmeans')
+    try:
+        return EXTRACTORS[name]
+    except KeyError:
+        raise ValueError(f"Unknown palette engine '{name}' (choose from {', '.join(EXTRACTORS)})")
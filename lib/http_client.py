@@ -0,0 +1,85 @@
+import aiohttp
+import asyncio
+import logging
+import os
+from typing import Optional
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class HttpClient:
+    """Shared, long-lived HTTP client for every image fetch
+
+    One pooled aiohttp session with a per-host connection limit, DNS
+    caching, keep-alive and timeouts, plus retry with exponential backoff
+    for connection errors and retryable statuses. Limits fall back to the
+    HTTP_LIMIT_PER_HOST and HTTP_RETRIES environment variables.
+    """
+    def __init__(self, limit_per_host: Optional[int] = None, retries: Optional[int] = None,
+                 backoff: float = 0.5, dns_ttl: int = 300, keepalive_timeout: int = 30,
+                 total_timeout: int = 30):
+        self.limit_per_host = limit_per_host or int(os.getenv('HTTP_LIMIT_PER_HOST', '8'))
+        self.retries = retries if retries is not None else int(os.getenv('HTTP_RETRIES', '3'))
+        self.backoff = backoff
+        self.dns_ttl = dns_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = aiohttp.ClientTimeout(total=total_timeout, sock_connect=10)
+        self.session = None
+        self.logger = logging.getLogger(__name__)
+
+    async def ensure_session(self) -> aiohttp.ClientSession:
+        """Lazy initialization of the pooled session"""
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=self.dns_ttl,
+                keepalive_timeout=self.keepalive_timeout
+            )
+            self.session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self.session
+
+    async def get_bytes(self, url: str, max_bytes: Optional[int] = None) -> bytes:
+        """GET a URL and return the body, retrying transient failures
+
+        With max_bytes the body is streamed and the download aborted (with
+        ValueError, not retried) as soon as it is known to be too large.
+        """
+        session = await self.ensure_session()
+        for attempt in range(self.retries + 1):
+            try:
+                async with session.get(url) as response:
+                    if response.status not in RETRY_STATUSES or attempt >= self.retries:
+                        response.raise_for_status()
+                        return await self._read_capped(response, max_bytes)
+                    error = f"HTTP {response.status}"
+
+            except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError,
+                    asyncio.TimeoutError) as e:
+                if attempt >= self.retries:
+                    raise
+                error = str(e) or type(e).__name__
+
+            delay = self.backoff * 2 ** attempt
+            self.logger.warning(f"Fetch of {url} failed ({error}); retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    async def _read_capped(response: aiohttp.ClientResponse, max_bytes: Optional[int]) -> bytes:
+        if max_bytes is None:
+            return await response.read()
+        if response.content_length is not None and response.content_length > max_bytes:
+            raise ValueError("Image too large")
+
+        buffer = bytearray()
+        async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+            buffer.extend(chunk)
+            if len(buffer) > max_bytes:
+                raise ValueError("Image too large")
+        return bytes(buffer)
+
+    async def close(self):
+        """Close the pooled session"""
+        if self.session and not self.session.closed:
+            await self.session.close()
+            self.session = None
@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import os
+import random
+from typing import List, Optional
+
+
+class AnalysisQueue:
+    """Worker pool that drains the persistent analysis_jobs table
+
+    !submit stores the artwork with a pending job and returns at once;
+    workers claim due jobs, extract the palette and Lab histogram and
+    store them. A failed attempt is retried with exponential backoff (plus
+    jitter) until max_attempts, after which the job is dead-lettered with
+    its last error. Jobs a previous process left running are requeued on start.
+    """
+    def __init__(self, storage, analyser, workers: Optional[int] = None,
+                 max_attempts: Optional[int] = None, retry_base: Optional[float] = None,
+                 poll_interval: Optional[float] = None):
+        self.storage = storage
+        self.analyser = analyser
+        self.workers = workers or int(os.getenv('ANALYSIS_WORKERS', '2'))
+        self.max_attempts = max_attempts or int(os.getenv('ANALYSIS_MAX_ATTEMPTS', '5'))
+        self.retry_base = retry_base or float(os.getenv('ANALYSIS_RETRY_BASE', '30'))
+        self.retry_max = 6 * 60 * 60
+        self.poll_interval = poll_interval or float(os.getenv('ANALYSIS_POLL_INTERVAL', '15'))
+        self.logger = logging.getLogger(__name__)
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self) -> None:
+        """Requeue interrupted jobs and start the workers (no-op if running)"""
+        if self._tasks:
+            return
+        requeued = await self.storage.requeue_running_analysis_jobs()
+        if requeued:
+            self.logger.info(f"Requeued {requeued} interrupted analysis jobs")
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def notify(self) -> None:
+        """Wake idle workers after a job was enqueued"""
+        self._wakeup.set()
+
+    async def _worker(self) -> None:
+        while True:
+            # Cleared before claiming, so a notify() that lands mid-claim still wakes us
+            self._wakeup.clear()
+            try:
+                job = await self.storage.claim_analysis_job()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.error(f"Claiming analysis job failed: {e}")
+                job = None
+
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._run(job)
+
+    async def _run(self, job: dict) -> None:
+        try:
+            analysis = await self.analyser.analyse(job['image_url'])
+            await self.storage.complete_analysis_job(
+                job['id'], job['artwork_id'], analysis['palette'], analysis['histogram']
+            )
+        except asyncio.CancelledError:
+            # Left 'running'; requeued by the next start()
+            raise
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            retry_in = None if job['attempts'] >= self.max_attempts else self._retry_delay(job['attempts'])
+            if retry_in is None:
+                self.logger.error(f"Analysis job {job['id']} (artwork {job['artwork_id']}) dead-lettered: {error}")
+            else:
+                self.logger.warning(f"Analysis job {job['id']} failed, retrying in {retry_in:.0f}s: {error}")
+            try:
+                await self.storage.fail_analysis_job(job['id'], error, retry_in)
+            except Exception as e:
+                self.logger.error(f"Recording analysis job failure failed: {e}")
+
+    def _retry_delay(self, attempts: int) -> float:
+        delay = min(self.retry_base * 2 ** (attempts - 1), self.retry_max)
+        return delay * random.uniform(0.8, 1.2)
+
+    async def close(self) -> None:
+        """Stop the workers; a job cut off mid-run is resumed on restart"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
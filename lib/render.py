@@ -0,0 +1,392 @@
+import abc
+import asyncio
+import io
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Sequence, Tuple
+
+from PIL import Image, ImageDraw, ImageFont, ImageOps
+
+
+class Renderer(abc.ABC):
+    """Interface shared by the chart renderers
+
+    Every method is synchronous, takes plain data and returns PNG bytes, so
+    it can run on any worker thread. connections are (artwork_index,
+    cluster_index, hex_color) triples.
+    """
+
+    @abc.abstractmethod
+    def trend_scatter(self, theme: str, artworks: List[dict]) -> bytes:
+        """ΔE-vs-score scatter of each artwork's best matches for !trend"""
+
+    @abc.abstractmethod
+    def overlap_diagram(self, clusters: List[dict], thumbnails: Sequence,
+                        connections: List[Tuple[int, int, str]], n_artworks: int) -> bytes:
+        """Cluster swatches above artwork thumbnails, joined by matched colors"""
+
+    @abc.abstractmethod
+    def overlap_comparison(self, clusters: List[dict], thumbnails: Sequence,
+                           connections: List[Tuple[int, int, str]], n_artworks: int) -> bytes:
+        """Cluster colour grid above artwork thumbnails with match lines"""
+
+    @abc.abstractmethod
+    def relationship_scatter(self, artworks: List[dict]) -> bytes:
+        """ΔE-vs-score scatter sized by similarity"""
+
+
+def _hex_to_unit_rgb(hex_color: str) -> Tuple[float, float, float]:
+    """Convert '#RRGGBB' to a matplotlib 0-1 RGB tuple"""
+    return tuple(int(hex_color.lstrip('#')[i:i+2], 16) / 255 for i in (0, 2, 4))
+
+
+def _new_figure(figsize):
+    """Create a standalone Agg figure (no pyplot global state)"""
+    # Imported lazily so deployments using PillowRenderer never load matplotlib
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    return fig, fig.add_subplot()
+
+
+def _to_png(fig, **kwargs) -> bytes:
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', bbox_inches='tight', **kwargs)
+    return buffer.getvalue()
+
+
+class MatplotlibRenderer(Renderer):
+    """Chart drawing with matplotlib's object-oriented Agg API"""
+
+    def trend_scatter(self, theme: str, artworks: List[dict]) -> bytes:
+        fig, ax = _new_figure((10, 6))
+
+        # Plot each artwork's best matches
+        for i, artwork in enumerate(artworks):
+            for match in artwork['best_matches']:
+                size = max(10, 100 - match['delta_e'])
+                ax.scatter(
+                    match['delta_e'],
+                    artwork['score'],
+                    c=[_hex_to_unit_rgb(match['hex'])],
+                    s=size,
+                    alpha=0.7,
+                    label=f"{artwork['artwork']['title']}" if i == 0 else ""
+                )
+
+        ax.set_xlabel('Color Difference (ΔE) → More Similar')
+        ax.set_ylabel('Match Score')
+        ax.set_title(f"Color Trends for '{theme}'")
+        ax.legend()
+        return _to_png(fig, dpi=100)
+
+    def overlap_diagram(self, clusters: List[dict], thumbnails: Sequence,
+                        connections: List[Tuple[int, int, str]], n_artworks: int) -> bytes:
+        fig, ax = _new_figure((12, 8))
+
+        # Plot clusters
+        for i, cluster in enumerate(clusters[:5]):
+            ax.scatter(
+                i, 1,
+                color=cluster['representative'],
+                s=500,
+                label=f"Group {i+1}"
+            )
+
+        # Plot artworks
+        for i, img in enumerate(thumbnails):
+            if img is not None:
+                ax.imshow(
+                    img,
+                    extent=(i-0.4, i+0.4, 0, 0.8),
+                    zorder=0
+                )
+
+        # Draw connection lines
+        for i, j, color in connections:
+            ax.plot(
+                [i, j],
+                [0.8, 1],
+                color=color,
+                alpha=0.6,
+                linewidth=2
+            )
+
+        ax.set_xlim(-0.5, max(4.5, n_artworks-0.5))
+        ax.set_ylim(-0.1, 1.5)
+        ax.axis('off')
+        ax.legend(loc='upper center', ncol=5)
+        return _to_png(fig, dpi=120)
+
+    def overlap_comparison(self, clusters: List[dict], thumbnails: Sequence,
+                           connections: List[Tuple[int, int, str]], n_artworks: int) -> bytes:
+        fig, ax = _new_figure((12, 8))
+
+        # Plot cluster centers
+        for i, cluster in enumerate(clusters[:5]):
+            for j, color in enumerate(cluster.get('representative_colors', [cluster['representative']])[:3]):
+                ax.scatter(
+                    i, j,
+                    color=color,
+                    s=300,
+                    edgecolors='white'
+                )
+
+        # Plot artwork thumbnails
+        for aw_idx, img in enumerate(thumbnails):
+            if img is not None:
+                ax.imshow(
+                    img,
+                    extent=(aw_idx-0.4, aw_idx+0.4, -2, -1),
+                    aspect='auto',
+                    zorder=0
+                )
+
+        # Plot matched colors
+        for aw_idx, cluster_idx, color in connections:
+            ax.plot(
+                [aw_idx, cluster_idx],
+                [-0.5, 0],
+                color=color,
+                linewidth=2,
+                alpha=0.7
+            )
+
+        ax.set_xlim(-1, max(5, n_artworks))
+        ax.set_ylim(-2.5, 2.5)
+        ax.axis('off')
+        ax.set_title('Color Palette Overlap Analysis', pad=20)
+        return _to_png(fig, dpi=120)
+
+    def relationship_scatter(self, artworks: List[dict]) -> bytes:
+        fig, ax = _new_figure((10, 6))
+
+        for artwork in artworks:
+            for match in artwork['best_matches']:
+                # Plot with size based on similarity
+                size = max(1, 100 - match['delta_e']) * 10
+                ax.scatter(
+                    match['delta_e'],
+                    artwork['score'],
+                    c=[_hex_to_unit_rgb(match['hex'])],
+                    s=size,
+                    alpha=0.7
+                )
+
+        ax.set_xlabel('Color Difference (ΔE)')
+        ax.set_ylabel('Match Score')
+        ax.set_title('Color Relationship Analysis')
+        return _to_png(fig)
+
+
+class _Plane:
+    """Maps data coordinates onto a pixel box inside a Pillow canvas"""
+    def __init__(self, box, x_range, y_range):
+        self.left, self.top, self.right, self.bottom = box
+        self.x0, self.x1 = x_range
+        self.y0, self.y1 = y_range
+
+    def __call__(self, x, y):
+        px = self.left + (x - self.x0) / ((self.x1 - self.x0) or 1) * (self.right - self.left)
+        py = self.bottom - (y - self.y0) / ((self.y1 - self.y0) or 1) * (self.bottom - self.top)
+        return px, py
+
+
+def _padded_range(values, pad=0.1):
+    lo, hi = min(values, default=0), max(values, default=1)
+    span = (hi - lo) or 1
+    return lo - span * pad, hi + span * pad
+
+
+def _marker_radius(area: float, dpi: int = 100) -> float:
+    """Pixel radius equivalent to a matplotlib scatter size (points^2)"""
+    return math.sqrt(area) / 2 * dpi / 72
+
+
+class PillowRenderer(Renderer):
+    """Lightweight chart drawing with PIL.ImageDraw (no matplotlib import)
+
+    Output matches the layout of MatplotlibRenderer closely enough for
+    Discord embeds, at a fraction of the cost per image.
+    """
+    background = (255, 255, 255)
+    ink = (40, 40, 40)
+    grid = (225, 225, 225)
+
+    def __init__(self):
+        self.font = ImageFont.load_default()
+
+    def _text(self, draw, xy, text, anchor='la', fill=None):
+        draw.text(xy, text, fill=fill or self.ink, font=self.font, anchor=anchor)
+
+    def _vertical_text(self, img, xy, text):
+        """Paste text rotated 90° with its centre at xy"""
+        left, top, right, bottom = self.font.getbbox(text)
+        label = Image.new('RGBA', (right - left + 2, bottom - top + 2), (0, 0, 0, 0))
+        ImageDraw.Draw(label).text((-left + 1, -top + 1), text, fill=self.ink, font=self.font)
+        label = label.rotate(90, expand=True)
+        img.paste(label, (int(xy[0] - label.width / 2), int(xy[1] - label.height / 2)), label)
+
+    def _scatter(self, points, title, xlabel, ylabel, size=(1000, 600)) -> bytes:
+        """points: (x, y, hex, area) tuples drawn as translucent dots with axes"""
+        width, height = size
+        img = Image.new('RGB', size, self.background)
+        draw = ImageDraw.Draw(img, 'RGBA')
+        box = (80, 50, width - 30, height - 70)
+        plane = _Plane(
+            box,
+            _padded_range([p[0] for p in points]),
+            _padded_range([p[1] for p in points])
+        )
+
+        # Axes, grid and tick labels
+        draw.rectangle(box, outline=self.ink)
+        for k in range(6):
+            x = plane.x0 + (plane.x1 - plane.x0) * k / 5
+            y = plane.y0 + (plane.y1 - plane.y0) * k / 5
+            px, _ = plane(x, plane.y0)
+            _, py = plane(plane.x0, y)
+            draw.line([(px, box[1] + 1), (px, box[3] - 1)], fill=self.grid)
+            draw.line([(box[0] + 1, py), (box[2] - 1, py)], fill=self.grid)
+            self._text(draw, (px, box[3] + 6), f"{x:.1f}", anchor='ma')
+            self._text(draw, (box[0] - 6, py), f"{y:.1f}", anchor='rm')
+
+        for x, y, hex_color, area in points:
+            cx, cy = plane(x, y)
+            r = _marker_radius(area)
+            rgb = tuple(int(hex_color.lstrip('#')[i:i+2], 16) for i in (0, 2, 4))
+            draw.ellipse([cx - r, cy - r, cx + r, cy + r], fill=rgb + (179,))  # alpha 0.7
+
+        self._text(draw, (width / 2, 18), title, anchor='ma')
+        self._text(draw, ((box[0] + box[2]) / 2, height - 30), xlabel, anchor='ma')
+        self._vertical_text(img, (28, (box[1] + box[3]) / 2), ylabel)
+        return self._to_png(img)
+
+    @staticmethod
+    def _to_png(img) -> bytes:
+        buffer = io.BytesIO()
+        # Fast zlib level: these are throwaway charts, size matters less than latency
+        img.save(buffer, format='PNG', compress_level=1)
+        return buffer.getvalue()
+
+    def trend_scatter(self, theme: str, artworks: List[dict]) -> bytes:
+        points = [
+            (match['delta_e'], artwork['score'], match['hex'], max(10, 100 - match['delta_e']))
+            for artwork in artworks for match in artwork['best_matches']
+        ]
+        return self._scatter(
+            points,
+            f"Color Trends for '{theme}'",
+            'Color Difference (dE) -> More Similar',  # default font has no Δ/→ glyphs
+            'Match Score'
+        )
+
+    def relationship_scatter(self, artworks: List[dict]) -> bytes:
+        points = [
+            (match['delta_e'], artwork['score'], match['hex'], max(1, 100 - match['delta_e']) * 10)
+            for artwork in artworks for match in artwork['best_matches']
+        ]
+        return self._scatter(points, 'Color Relationship Analysis', 'Color Difference (dE)', 'Match Score')
+
+    def _diagram(self, plane, img, swatches, thumbnails, thumb_rows, connections, line_rows):
+        """Shared body of the overlap diagrams: thumbnails, match lines, then swatches"""
+        draw = ImageDraw.Draw(img, 'RGBA')
+        y_bottom, y_top = thumb_rows
+        for i, thumb in enumerate(thumbnails):
+            if thumb is None:
+                continue
+            left, top = plane(i - 0.4, y_top)
+            right, bottom = plane(i + 0.4, y_bottom)
+            tile = ImageOps.contain(thumb.convert('RGB'), (int(right - left), int(bottom - top)))
+            img.paste(tile, (int(left + (right - left - tile.width) / 2),
+                             int(top + (bottom - top - tile.height) / 2)))
+
+        y_from, y_to = line_rows
+        for i, j, color in connections:
+            rgb = tuple(int(color.lstrip('#')[k:k+2], 16) for k in (0, 2, 4))
+            draw.line([plane(i, y_from), plane(j, y_to)], fill=rgb + (153,), width=3)
+
+        for x, y, color, area in swatches:
+            cx, cy = plane(x, y)
+            r = _marker_radius(area, dpi=120)
+            draw.ellipse([cx - r, cy - r, cx + r, cy + r], fill=color, outline='white', width=2)
+        return draw
+
+    def overlap_diagram(self, clusters: List[dict], thumbnails: Sequence,
+                        connections: List[Tuple[int, int, str]], n_artworks: int) -> bytes:
+        size = (1440, 960)
+        img = Image.new('RGB', size, self.background)
+        plane = _Plane((20, 20, size[0] - 20, size[1] - 20),
+                       (-0.5, max(4.5, n_artworks - 0.5)), (-0.1, 1.5))
+        swatches = [(i, 1, cluster['representative'], 500) for i, cluster in enumerate(clusters[:5])]
+        draw = self._diagram(plane, img, swatches, thumbnails, (0, 0.8), connections, (0.8, 1))
+
+        # Legend under each swatch
+        for i, cluster in enumerate(clusters[:5]):
+            x, y = plane(i, 1)
+            self._text(draw, (x, y + 30), f"Group {i+1}", anchor='ma')
+        return self._to_png(img)
+
+    def overlap_comparison(self, clusters: List[dict], thumbnails: Sequence,
+                           connections: List[Tuple[int, int, str]], n_artworks: int) -> bytes:
+        size = (1440, 960)
+        img = Image.new('RGB', size, self.background)
+        plane = _Plane((20, 60, size[0] - 20, size[1] - 20),
+                       (-1, max(5, n_artworks)), (-2.5, 2.5))
+        swatches = [
+            (i, j, color, 300)
+            for i, cluster in enumerate(clusters[:5])
+            for j, color in enumerate(cluster.get('representative_colors', [cluster['representative']])[:3])
+        ]
+        draw = self._diagram(plane, img, swatches, thumbnails, (-2, -1), connections, (-0.5, 0))
+        self._text(draw, (size[0] / 2, 24), 'Color Palette Overlap Analysis', anchor='ma')
+        return self._to_png(img)
+
+
+RENDERERS = {
+    'matplotlib': MatplotlibRenderer,
+    'pillow': PillowRenderer,
+}
+
+
+def get_renderer(name: Optional[str] = None) -> Renderer:
+    """Renderer by name, defaulting to the RENDERER environment variable"""
+    name = (name or os.getenv('RENDERER', 'matplotlib')).lower()
+    if name not in RENDERERS:
+        raise ValueError(f"Unknown renderer '{name}' (expected one of {', '.join(RENDERERS)})")
+    return RENDERERS[name]()
+
+
+class RenderPool:
+    """Bounded executor that runs chart rendering off the event loop
+
+    renderer defaults to get_renderer() (RENDERER environment variable) and
+    max_workers falls back to the RENDER_WORKERS environment variable.
+    """
+    def __init__(self, renderer: Optional[Renderer] = None, max_workers: Optional[int] = None):
+        self.renderer = renderer or get_renderer()
+        self.max_workers = max_workers or int(os.getenv('RENDER_WORKERS', '2'))
+        self._executor = None
+
+    def _ensure_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix='render'
+            )
+        return self._executor
+
+    async def render(self, chart: str, *args) -> bytes:
+        """Run renderer.<chart>(*args) on a worker and return the PNG bytes"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._ensure_executor(), getattr(self.renderer, chart), *args
+        )
+
+    async def close(self):
+        """Wait for in-flight renders and stop the workers"""
+        if self._executor is not None:
+            executor, self._executor = self._executor, None
+            await asyncio.to_thread(executor.shutdown, wait=True, cancel_futures=True)
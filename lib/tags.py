@@ -0,0 +1,72 @@
+import bisect
+import difflib
+from typing import Dict, Iterable, List, Set
+
+class TagIndex:
+    """In-memory lookup from a user query to the distinct tags it matches
+
+    Exact and prefix lookups use a set and a sorted list; substring and fuzzy
+    lookups use a trigram index. The resolved tags are then passed to SQL as
+    an IN list so MySQL can use idx_tag instead of scanning with LIKE '%..%'.
+    """
+    def __init__(self, fuzzy_cutoff: float = 0.75, max_fuzzy: int = 5):
+        self.fuzzy_cutoff = fuzzy_cutoff
+        self.max_fuzzy = max_fuzzy
+        self.loaded = False
+        self._tags: Set[str] = set()
+        self._sorted: List[str] = []
+        self._trigrams: Dict[str, Set[str]] = {}
+
+    @staticmethod
+    def _grams(text: str) -> Set[str]:
+        return {text[i:i+3] for i in range(len(text) - 2)}
+
+    def rebuild(self, tags: Iterable[str]) -> None:
+        """Replace the index contents with the given tags"""
+        self._tags = set()
+        self._sorted = []
+        self._trigrams = {}
+        self.add(tags)
+        self.loaded = True
+
+    def add(self, tags: Iterable[str]) -> None:
+        """Index newly submitted tags"""
+        for tag in tags:
+            tag = tag.strip().lower()
+            if not tag or tag in self._tags:
+                continue
+            self._tags.add(tag)
+            bisect.insort(self._sorted, tag)
+            for gram in self._grams(tag):
+                self._trigrams.setdefault(gram, set()).add(tag)
+
+    def prefix(self, query: str) -> List[str]:
+        """All tags starting with query"""
+        start = bisect.bisect_left(self._sorted, query)
+        end = bisect.bisect_left(self._sorted, query + '\uffff')
+        return self._sorted[start:end]
+
+    def substring(self, query: str) -> List[str]:
+        """All tags containing query (same semantics as LIKE '%query%', len >= 3)"""
+        grams = self._grams(query)
+        candidates = set.intersection(*(self._trigrams.get(g, set()) for g in grams))
+        return sorted(tag for tag in candidates if query in tag)
+
+    def fuzzy(self, query: str) -> List[str]:
+        """Closest tags to a misspelt query, drawn from trigram neighbours"""
+        candidates = set()
+        for gram in self._grams(query):
+            candidates |= self._trigrams.get(gram, set())
+        return difflib.get_close_matches(
+            query, candidates or self._tags, n=self.max_fuzzy, cutoff=self.fuzzy_cutoff
+        )
+
+    def resolve(self, query: str) -> List[str]:
+        """Resolve a user query to the list of stored tags it should match"""
+        query = query.strip().lower()
+        if not query:
+            return []
+        if len(query) < 3:
+            # Too short for trigrams; one or two letters only match as a prefix
+            return self.prefix(query)
+        return self.substring(query) or self.fuzzy(query)
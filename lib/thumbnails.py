@@ -0,0 +1,138 @@
+import asyncio
+import io
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from PIL import Image
+
+
+class ThumbnailCache:
+    """Two-tier cache of artwork thumbnails keyed by artwork ID and size
+
+    Decoded images live in a byte-bounded in-memory LRU; every thumbnail is
+    also written as WebP to cache_dir, which is trimmed oldest-first once it
+    passes its own byte cap. Artworks never change, so entries never go
+    stale. Settings fall back to THUMBNAIL_MEMORY_BYTES, THUMBNAIL_CACHE_DIR
+    and THUMBNAIL_DISK_BYTES.
+    """
+    def __init__(self, memory_bytes: Optional[int] = None, cache_dir: Optional[str] = None,
+                 disk_bytes: Optional[int] = None):
+        self.memory_bytes = memory_bytes or int(os.getenv('THUMBNAIL_MEMORY_BYTES', str(32 * 1024 * 1024)))
+        self.cache_dir = cache_dir or os.getenv('THUMBNAIL_CACHE_DIR', '.thumbnail_cache')
+        self.disk_bytes = disk_bytes or int(os.getenv('THUMBNAIL_DISK_BYTES', str(256 * 1024 * 1024)))
+        self.logger = logging.getLogger(__name__)
+        self._memory: "OrderedDict[Tuple[int, int, int], Image.Image]" = OrderedDict()
+        self._memory_used = 0
+        self._disk_used = None  # Measured on first write
+        self._disk_lock = threading.Lock()  # Disk writes run on to_thread workers
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _footprint(image: Image.Image) -> int:
+        return image.width * image.height * len(image.getbands())
+
+    def _path(self, key: Tuple[int, int, int]) -> str:
+        artwork_id, width, height = key
+        return os.path.join(self.cache_dir, f"{artwork_id}_{width}x{height}.webp")
+
+    async def get(self, artwork_id: int, size: Tuple[int, int]) -> Optional[Image.Image]:
+        """Cached thumbnail, checking memory first and then disk"""
+        key = (artwork_id, *size)
+        image = self._memory.get(key)
+        if image is not None:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return image
+
+        image = await asyncio.to_thread(self._read_disk, key)
+        if image is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._remember(key, image)
+        return image
+
+    async def put(self, artwork_id: int, size: Tuple[int, int], image: Image.Image) -> None:
+        """Store a thumbnail in both tiers"""
+        key = (artwork_id, *size)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+        self._remember(key, image)
+        try:
+            await asyncio.to_thread(self._write_disk, key, image)
+        except OSError as e:
+            self.logger.warning(f"Thumbnail disk cache write failed: {e}")
+
+    def _remember(self, key, image: Image.Image) -> None:
+        if key in self._memory:
+            self._memory_used -= self._footprint(self._memory.pop(key))
+        self._memory[key] = image
+        self._memory_used += self._footprint(image)
+        while self._memory_used > self.memory_bytes and len(self._memory) > 1:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_used -= self._footprint(evicted)
+
+    def _read_disk(self, key) -> Optional[Image.Image]:
+        path = self._path(key)
+        try:
+            with Image.open(path) as img:
+                img.load()
+                image = img.copy()
+            os.utime(path)  # Mark as recently used for eviction
+            return image
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            self.logger.warning(f"Discarding unreadable thumbnail {path}: {e}")
+            self._remove(path)
+            return None
+
+    def _write_disk(self, key, image: Image.Image) -> None:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        buffer = io.BytesIO()
+        image.save(buffer, format='WEBP', quality=85)
+        path = self._path(key)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(buffer.getvalue())
+        os.replace(tmp_path, path)
+
+        with self._disk_lock:
+            if self._disk_used is None:
+                self._disk_used = sum(size for _, size, _ in self._scan())
+            else:
+                self._disk_used += buffer.tell()
+            if self._disk_used > self.disk_bytes:
+                self._evict_disk()
+
+    def _scan(self):
+        """(path, size, mtime) for every cached file"""
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and entry.name.endswith('.webp'):
+                stat = entry.stat()
+                entries.append((entry.path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def _evict_disk(self) -> None:
+        """Delete least recently used files until under 90% of the disk cap (hold _disk_lock)"""
+        entries = sorted(self._scan(), key=lambda e: e[2])
+        used = sum(size for _, size, _ in entries)
+        target = self.disk_bytes * 0.9
+        for path, size, _ in entries:
+            if used <= target:
+                break
+            self._remove(path)
+            used -= size
+        self._disk_used = used
+
+    def _remove(self, path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass